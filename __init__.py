@@ -5,13 +5,37 @@ __email__ = 'a@shepetko.com'
 __license__ = 'MIT'
 
 # Public API
-from . import error, types, reply_markup
-from ._api import register_bot, unregister_bot, dispense_bot
+from . import error, types, reply_markup, middleware, inline, file_ids, metrics
+from ._api import register_bot, register_bots, unregister_bot, dispense_bot
+from ._sender import PRIORITY_INTERACTIVE, PRIORITY_NORMAL, PRIORITY_BULK
 from ._bot import Bot
 
 
+def plugin_load():
+    from pytsite import reg
+
+    if reg.get('telegram.metrics', False):
+        metrics.set_sink(metrics.PrometheusSink())
+
+
+def plugin_load_console():
+    from pytsite import console
+    from . import _console
+
+    console.register_command(_console.Replay())
+    console.register_command(_console.FakeServer())
+
+
 def plugin_load_wsgi():
-    from pytsite import router
+    from pytsite import router, reg
     from . import _controllers
 
     router.handle(_controllers.PostHook, '/telegram/hook/<bot_uid>', 'telegram@bot_hook', methods='POST')
+
+    # Resume sending of calls left in the outbox before restart
+    if reg.get('telegram.outbox', False):
+        from . import _outbox
+        _outbox.get_outbox().start()
+
+    if reg.get('telegram.metrics', False):
+        router.handle(_controllers.Metrics, reg.get('telegram.metrics_path', '/telegram/metrics'), 'telegram@metrics')
@@ -0,0 +1,95 @@
+"""PytSite Telegram Incoming Updates Admission
+"""
+__author__ = 'Oleksandr Shepetko'
+__email__ = 'a@shepetko.com'
+__license__ = 'MIT'
+
+import threading as _threading
+from time import monotonic as _monotonic
+from typing import Dict, Optional, Tuple
+from pytsite import reg, logger
+from . import metrics as _metrics
+
+DROPPED = 'dropped'
+DEFERRED = 'deferred'
+
+_inflight = 0
+_lock = _threading.Lock()
+_shed = {}  # type: Dict[Tuple[str, str], int]
+_last_report = 0.0
+
+_metrics.register_gauge('telegram_inflight_updates', lambda: _inflight, 'Updates being processed by webhook handlers')
+
+
+def inflight() -> int:
+    """Get number of updates being processed by webhook handlers
+    """
+    return _inflight
+
+
+def shed_counts() -> Dict[Tuple[str, str], int]:
+    """Get numbers of shed updates keyed by update kind and action
+    """
+    with _lock:
+        return dict(_shed)
+
+
+def _verdict(kind: str, load: int) -> Optional[str]:
+    limit = reg.get('telegram.max_inflight_updates', 0)
+    if not limit:
+        return None
+
+    if load >= limit:
+        return DEFERRED
+
+    if load >= limit * reg.get('telegram.shed_threshold', 0.8) and \
+            kind in reg.get('telegram.shed_update_kinds', ('edited_message', 'edited_channel_post')):
+        return DROPPED
+
+    return None
+
+
+def enter(kind: str, load: int = None) -> Optional[str]:
+    """Decide whether to admit an update
+
+    Admission is bounded by the `telegram.max_inflight_updates` registry parameter. When the load reaches
+    `telegram.shed_threshold` of the limit, updates of kinds listed in `telegram.shed_update_kinds` are dropped; when
+    the limit is reached, all updates are deferred. Returns None if the update is admitted, DROPPED or DEFERRED
+    otherwise. If `load` is not specified, updates being processed by webhook handlers are counted, and an admitted
+    update must be released by `leave()`.
+    """
+    global _inflight, _last_report
+
+    with _lock:
+        verdict = _verdict(kind, _inflight if load is None else load)
+        if verdict is None:
+            if load is None:
+                _inflight += 1
+            return None
+
+        _shed[(kind, verdict)] = _shed.get((kind, verdict), 0) + 1
+
+        now = _monotonic()
+        report = now - _last_report >= 60
+        if report:
+            _last_report = now
+            totals = dict(_shed)
+
+    sink = _metrics.get_sink()
+    if sink:
+        sink.inc('telegram_updates_shed_total', 1, {'kind': kind, 'action': verdict})
+
+    if report:
+        logger.warn('Telegram updates are being shed due to overload, totals: {}'.format(
+            ', '.join('{} {}: {}'.format(k[0], k[1], v) for k, v in sorted(totals.items()))))
+
+    return verdict
+
+
+def leave():
+    """Release an update admitted by `enter()`
+    """
+    global _inflight
+
+    with _lock:
+        _inflight -= 1
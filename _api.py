@@ -4,23 +4,39 @@ __author__ = 'Oleksandr Shepetko'
 __email__ = 'a@shepetko.com'
 __license__ = 'MIT'
 
+import os as _os
+import json as _json
 import requests as _requests
-from typing import Type, Dict, Tuple
-from pytsite import util, router
-from . import _bot, error as _error
+from concurrent.futures import ThreadPoolExecutor as _ThreadPoolExecutor, Future as _Future
+from typing import Type, Dict, Tuple, Iterator, Iterable, Optional, Union
+from time import monotonic as _monotonic
+from pytsite import util, router, reg, cache, logger
+from . import _bot, _sender, _multipart, types, metrics as _metrics, error as _error
 
 # Registered bots
 _BOTS = {}  # type: Dict[str, Tuple[Type, str]]
 
+# Hashes of webhooks configurations known to be set
+_webhooks_pool = cache.create_pool('telegram.webhooks')
 
-def register_bot(token: str, bot_class: Type, set_webhook: bool = True, max_connections: int = 40,
-                 allowed_updates: list = None):
-    """Register a new bot
+# HTTP session, created once per process
+_session = None  # type: _requests.Session
+_session_pid = None  # type: int
+
+
+def bot_uid(token: str) -> str:
+    """Get UID of a bot, which identifies it in URLs and storages without exposing its token
+    """
+    return util.md5_hex_digest(router.server_name() + token)
+
+
+def _add_bot(token: str, bot_class: Type, set_webhook: bool) -> str:
+    """Add a bot to the registry
     """
     if not token:
         raise ValueError("Bot's token is empty")
 
-    uid = util.md5_hex_digest(router.server_name() + token)
+    uid = bot_uid(token)
     if uid in _BOTS:
         raise ValueError("Bot with token '{}' is already registered".format(token))
 
@@ -32,8 +48,73 @@ def register_bot(token: str, bot_class: Type, set_webhook: bool = True, max_conn
 
     _BOTS[uid] = (bot_class, token, set_webhook)
 
+    return uid
+
+
+def _allowed_updates(token: str, bot_class: Type, allowed_updates: Optional[list]) -> list:
+    """Get kinds of updates to subscribe a bot to
+    """
+    if allowed_updates is None:
+        allowed_updates = bot_class.derive_allowed_updates()
+        logger.info("Allowed updates of bot '{}' derived from {}: {}".format(
+            _metrics.bot_label(token), bot_class.__name__, ', '.join(allowed_updates) or 'all'))
+
+    return allowed_updates
+
+
+def register_bot(token: str, bot_class: Type, set_webhook: bool = True, max_connections: int = 40,
+                 allowed_updates: list = None):
+    """Register a new bot
+
+    If `allowed_updates` is not specified, the bot is subscribed only to kinds of updates its class handles, see
+    `Bot.derive_allowed_updates()`. An empty list subscribes the bot to all kinds of updates.
+    """
+    uid = _add_bot(token, bot_class, set_webhook)
+
     if set_webhook:
-        _set_webhook(token, uid, max_connections, allowed_updates)
+        _set_webhook(token, uid, max_connections, _allowed_updates(token, bot_class, allowed_updates))
+
+
+def register_bots(bots: Iterable[Union[tuple, dict]], background: bool = False,
+                  max_workers: int = 16) -> Union[Dict[str, Optional[Exception]], _Future]:
+    """Register several bots, setting their webhooks concurrently
+
+    Each item of `bots` is a tuple or a dict of `register_bot()` arguments. Bots are registered at once, while their
+    webhooks are checked and set by `max_workers` threads. A failure of one bot does not affect others: errors are
+    logged and returned in a dict keyed by bot tokens, where None means success. If `background` is True, the function
+    returns immediately and a future of that dict is returned.
+    """
+    webhooks = []
+    for args in bots:
+        kwargs = dict(args) if isinstance(args, dict) else dict(zip(('token', 'bot_class', 'set_webhook',
+                                                                     'max_connections', 'allowed_updates'), args))
+        uid = _add_bot(kwargs['token'], kwargs['bot_class'], kwargs.get('set_webhook', True))
+        if kwargs.get('set_webhook', True):
+            webhooks.append((kwargs['token'], uid, kwargs.get('max_connections', 40),
+                             _allowed_updates(kwargs['token'], kwargs['bot_class'], kwargs.get('allowed_updates'))))
+
+    def set_one(token: str, uid: str, max_connections: int, allowed_updates: list) -> Optional[Exception]:
+        try:
+            _set_webhook(token, uid, max_connections, allowed_updates)
+        except Exception as e:
+            logger.error("Cannot set webhook of bot '{}': {}".format(_metrics.bot_label(token), e))
+            return e
+
+    def set_all() -> Dict[str, Optional[Exception]]:
+        if not webhooks:
+            return {}
+
+        with _ThreadPoolExecutor(min(max_workers, len(webhooks))) as executor:
+            futures = [(w[0], executor.submit(set_one, *w)) for w in webhooks]
+            return {token: f.result() for token, f in futures}
+
+    if background:
+        executor = _ThreadPoolExecutor(1)
+        future = executor.submit(set_all)
+        executor.shutdown(wait=False)
+        return future
+
+    return set_all()
 
 
 def unregister_bot(token: str):
@@ -42,10 +123,12 @@ def unregister_bot(token: str):
     if not token:
         raise ValueError("Bot's token is not registered")
 
-    uid = util.md5_hex_digest(router.server_name() + token)
+    uid = bot_uid(token)
     if uid in _BOTS:
         if _BOTS[uid][2]:
             _delete_webhook(token)
+            if _webhooks_pool.has(uid):
+                _webhooks_pool.rm(uid)
         del _BOTS[uid]
 
 
@@ -59,11 +142,111 @@ def dispense_bot(uid: str) -> _bot.Bot:
         raise _error.BotNotRegistered(uid)
 
 
-def request(bot_token: str, endpoint: str, params: dict = None, data: dict = None, method: str = 'GET'):
+def session() -> _requests.Session:
+    """Get HTTP session which keeps connections to the Telegram API alive
+    """
+    global _session, _session_pid
+
+    if _session_pid != _os.getpid():
+        _session = _requests.Session()
+        _session_pid = _os.getpid()
+
+    return _session
+
+
+def iter_download(url: str, chunk_size: int = 65536, max_size: int = None, max_retries: int = 3) -> Iterator[bytes]:
+    """Download a file chunk by chunk
+
+    Interrupted downloads are resumed from the last received byte up to `max_retries` times.
+    """
+    received = 0
+    retries = 0
+
+    while True:
+        headers = {'Range': 'bytes={}-'.format(received)} if received else None
+        try:
+            with session().get(url, headers=headers, stream=True, timeout=30) as resp:
+                if not resp.ok:
+                    raise _error.ApiRequestError('GET', url, resp)
+
+                if received and resp.status_code != 206:
+                    raise _error.Error('Server does not support resuming of downloads: {}'.format(url))
+
+                length = resp.headers.get('Content-Length')
+                if max_size and length and received + int(length) > max_size:
+                    raise _error.FileTooLarge(url, max_size)
+
+                for chunk in resp.iter_content(chunk_size):
+                    received += len(chunk)
+                    if max_size and received > max_size:
+                        raise _error.FileTooLarge(url, max_size)
+                    yield chunk
+
+                return
+
+        except (_requests.ConnectionError, _requests.Timeout, _requests.exceptions.ChunkedEncodingError):
+            retries += 1
+            if retries > max_retries:
+                raise
+
+            sink = _metrics.get_sink()
+            if sink:
+                sink.inc('telegram_api_retries_total', 1, {'endpoint': 'download'})
+
+
+def api_url() -> str:
+    """Get base URL of the Telegram Bot API, which is set by the `telegram.api_url` registry parameter
+    """
+    return reg.get('telegram.api_url', 'https://api.telegram.org').rstrip('/')
+
+
+def request(bot_token: str, endpoint: str, params: dict = None, data: dict = None, method: str = 'GET',
+            priority: int = None, deadline: float = None, files: Dict[str, types.InputFile] = None,
+            body: bytes = None, timeout: float = None):
     """Perform a request to the Telegram API
+
+    If the `telegram.rate_limit` registry parameter is set, the request waits for a rate limit slot, which is granted
+    in order of `priority` and given up after `deadline` seconds. If `files` are specified, they are streamed in a
+    multipart POST request body along with `params` and `data`. If `body` is specified, it is POSTed as JSON.
+
+    `timeout` limits the whole call in seconds, including waiting for a rate limit slot, and is passed to the HTTP
+    request as is left of it. By default, the HTTP request's timeout is set by the `telegram.request_timeout` registry
+    parameter.
     """
-    url = 'https://api.telegram.org/bot{}/{}'.format(bot_token, endpoint)
-    resp = _requests.request(method, url, params=params, data=data)
+    started = _monotonic()
+    rate = reg.get('telegram.rate_limit', 0)
+    if rate:
+        if priority is None:
+            priority = _sender.endpoint_priority(endpoint)
+        if deadline is None:
+            deadline = _sender.priority_deadline(priority)
+        _sender.get_scheduler(bot_token, rate).acquire(priority, _monotonic() + deadline if deadline else None)
+
+    if timeout is None:
+        timeout = reg.get('telegram.request_timeout', 30)
+    else:
+        timeout = max(timeout - (_monotonic() - started), 0.001)
+
+    url = '{}/bot{}/{}'.format(api_url(), bot_token, endpoint)
+    sink = _metrics.get_sink()
+    start = _monotonic() if sink else None
+
+    if body is not None:
+        resp = session().post(url, data=body, headers={'Content-Type': 'application/json'}, timeout=timeout)
+    elif files:
+        fields = dict(params or {})
+        fields.update(data or {})
+        body, content_type = _multipart.encode(fields, files)
+        resp = session().post(url, data=body, headers={'Content-Type': content_type}, timeout=timeout)
+    else:
+        resp = session().request(method, url, params=params, data=data, timeout=timeout)
+
+    if sink:
+        labels = {'bot': _metrics.bot_label(bot_token), 'endpoint': endpoint}
+        sink.observe('telegram_api_request_duration_seconds', _monotonic() - start, labels)
+        if resp.status_code >= 400:
+            status = '429' if resp.status_code == 429 else '{}xx'.format(resp.status_code // 100)
+            sink.inc('telegram_api_errors_total', 1, dict(labels, status=status))
 
     if not resp.ok:
         raise _error.ApiRequestError(method, url, resp)
@@ -74,16 +257,29 @@ def request(bot_token: str, endpoint: str, params: dict = None, data: dict = Non
 def _set_webhook(bot_token: str, bot_uid: str, max_connections: int = 40, allowed_updates: list = None) -> bool:
     """Specify an URL and receive incoming updates via an outgoing webhook
 
+    Hash of the webhook's configuration is cached for the `telegram.webhook_cache_ttl` seconds after the webhook is
+    known to be set, so following calls with the same configuration, e.g. after restarts, make no requests.
+
     https://core.telegram.org/bots/api#setwebhook
     """
-    hook_url = router.rule_url('telegram@bot_hook', {'bot_uid': bot_uid}, scheme='https')
-    if _get_webhook_info(bot_token)['url'] != hook_url:
+    config = {
+        'url': router.rule_url('telegram@bot_hook', {'bot_uid': bot_uid}, scheme='https'),
+        'max_connections': max_connections,
+        'allowed_updates': sorted(allowed_updates or []),
+    }
+    config_hash = util.md5_hex_digest(_json.dumps(config, sort_keys=True))
+
+    try:
+        if _webhooks_pool.get(bot_uid) == config_hash:
+            return True
+    except cache.error.KeyNotExist:
+        pass
+
+    info = _get_webhook_info(bot_token)
+    if info.get('url') != config['url'] or info.get('max_connections', 40) != max_connections or \
+            sorted(info.get('allowed_updates') or []) != config['allowed_updates']:
         try:
-            return request(bot_token, 'setWebhook', {
-                'url': hook_url,
-                'max_connections': max_connections,
-                'allowed_updates': allowed_updates or [],
-            })
+            request(bot_token, 'setWebhook', method='POST', body=_json.dumps(config).encode('utf-8'))
 
         except _error.ApiRequestError as e:
             if e.response.status_code == 404:
@@ -91,6 +287,10 @@ def _set_webhook(bot_token: str, bot_uid: str, max_connections: int = 40, allowe
 
             raise e
 
+    _webhooks_pool.put(bot_uid, config_hash, reg.get('telegram.webhook_cache_ttl', 86400))
+
+    return True
+
 
 def _get_webhook_info(bot_token: str) -> dict:
     """Get current webhook status
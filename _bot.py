@@ -4,17 +4,145 @@ __author__ = 'Oleksandr Shepetko'
 __email__ = 'a@shepetko.com'
 __license__ = 'MIT'
 
+import os
 import json
-from typing import Union, Mapping
+import threading as _threading
+import requests as _requests
+from contextlib import contextmanager
+from collections import OrderedDict as _OrderedDict
+from time import monotonic as _monotonic
+from typing import Union, Mapping, Dict, Callable, Optional, Tuple, List, Iterable, Iterator, BinaryIO
 from werkzeug.utils import cached_property
 from pytsite import cache, reg, logger, lang, util
-from . import _api, types, error
+from . import _api, _endpoint, _callback_data, _outbox, _profiler, _watchdog, types, error, inline, file_ids, \
+    metrics as _metrics, middleware as _middleware
 from .reply_markup import ReplyMarkup
 
 _cache_pool = cache.create_pool('telegram.bot_state')
+_media_groups = {}  # type: Dict[str, Tuple[int, Dict[int, dict]]]
+_media_groups_lock = _threading.Lock()
+_inline_results_pool = cache.create_pool('telegram.inline_results')
+_callback_queries = _OrderedDict()  # type: Dict[str, float]
+_callback_queries_lock = _threading.Lock()
+_files_pool = cache.create_pool('telegram.files')
+_files_pending = {}  # type: Dict[str, _PendingCall]
+_files_lock = _threading.Lock()
+_identities = {}  # type: Dict[str, types.User]
+
+
+# Precompiled parameters templates of endpoints
+_SEND_MESSAGE = _endpoint.Endpoint('sendMessage', (
+    'chat_id', 'text', 'parse_mode', 'disable_web_page_preview', 'disable_notification', 'reply_to_message_id',
+    'reply_markup'))
+_EDIT_MESSAGE_TEXT = _endpoint.Endpoint('editMessageText', (
+    'text', 'chat_id', 'message_id', 'inline_message_id', 'parse_mode', 'disable_web_page_preview', 'reply_markup'))
+_EDIT_MESSAGE_CAPTION = _endpoint.Endpoint('editMessageCaption', (
+    'caption', 'chat_id', 'message_id', 'inline_message_id', 'reply_markup'))
+_EDIT_MESSAGE_REPLY_MARKUP = _endpoint.Endpoint('editMessageReplyMarkup', (
+    'chat_id', 'message_id', 'inline_message_id', 'reply_markup'))
+_ANSWER_CALLBACK_QUERY = _endpoint.Endpoint('answerCallbackQuery', (
+    'callback_query_id', 'text', 'show_alert', 'url', 'cache_time'))
+_ANSWER_PRE_CHECKOUT_QUERY = _endpoint.Endpoint('answerPreCheckoutQuery', (
+    'pre_checkout_query_id', 'ok', 'error_message'))
+_ANSWER_INLINE_QUERY = _endpoint.Endpoint('answerInlineQuery', (
+    'inline_query_id', 'results', 'cache_time', 'is_personal', 'next_offset', 'switch_pm_text',
+    'switch_pm_parameter'), ('results',))
+_DELETE_MESSAGE = _endpoint.Endpoint('deleteMessage', (
+    'chat_id', 'message_id'))
+_SEND_PHOTO = _endpoint.Endpoint('sendPhoto', (
+    'photo', 'chat_id', 'caption', 'disable_notification', 'reply_to_message_id', 'reply_markup'))
+_SEND_DOCUMENT = _endpoint.Endpoint('sendDocument', (
+    'document', 'chat_id', 'caption', 'disable_notification', 'reply_to_message_id', 'reply_markup'))
+_SEND_VIDEO = _endpoint.Endpoint('sendVideo', (
+    'video', 'chat_id', 'duration', 'width', 'height', 'caption', 'supports_streaming', 'disable_notification',
+    'reply_to_message_id', 'reply_markup'))
+_SEND_AUDIO = _endpoint.Endpoint('sendAudio', (
+    'audio', 'chat_id', 'caption', 'duration', 'performer', 'title', 'disable_notification', 'reply_to_message_id',
+    'reply_markup'))
+_SEND_MEDIA_GROUP = _endpoint.Endpoint('sendMediaGroup', (
+    'chat_id', 'media', 'disable_notification', 'reply_to_message_id'))
+
+
+class _PendingCall:
+    """API call, results of which are awaited by several callers
+    """
+
+    def __init__(self):
+        self.done = _threading.Event()
+        self.result = None
+        self.error = None  # type: Optional[Exception]
+
+
+class _MediaGroupUpdate(types.Update):
+    """Update delivering an album aggregated from several updates
+    """
+
+    def __init__(self, update_id: int, group: types.MediaGroup):
+        super().__init__({'update_id': update_id, 'message': group.messages[0].raw})
+
+        self.media_group = group
 
 
 class Bot:
+    # Command handlers and aliases, built once per class
+    _commands = {}  # type: Dict[str, Callable]
+    _command_aliases = {}  # type: Dict[str, str]
+
+    # Middleware applied to this class's bots in addition to globally registered ones
+    middlewares = ()  # type: Tuple[_middleware.Middleware, ...]
+
+    def __init_subclass__(cls, **kwargs):
+        """Build command routing table of a subclass
+        """
+        super().__init_subclass__(**kwargs)
+
+        # Handlers are looked up over the whole MRO, so ones defined in mixins are registered too
+        commands = dict(cls._commands)
+        for attr_name in dir(cls):
+            if attr_name.startswith('cmd_'):
+                attr = getattr(cls, attr_name)
+                if callable(attr):
+                    commands[attr_name[4:]] = attr
+
+        cls._commands = commands
+        cls._command_aliases = dict(cls._command_aliases)
+
+    @classmethod
+    def derive_allowed_updates(cls) -> List[str]:
+        """Get kinds of updates the class handles, based on hooks it overrides
+
+        An empty list, which means all kinds, is returned if the class overrides update processing itself or uses
+        a middleware wrapping it.
+        """
+        def overrides(name: str) -> bool:
+            return getattr(cls, name) is not getattr(Bot, name)
+
+        if overrides('process_update') or overrides('dispatch_update'):
+            return []
+
+        for mw in _middleware.get_chain(cls):
+            if type(mw).process_update is not _middleware.Middleware.process_update:
+                return []
+
+        kinds = set()
+
+        # Messages, their edits and callback queries are all delivered to commands or the private messages hook
+        if cls._commands or any(overrides(h) for h in ('handle_private_message', 'handle_media_group',
+                                                        'handle_command', 'call_command')):
+            kinds.update(('message', 'edited_message', 'callback_query'))
+
+        for hook, hook_kinds in (('handle_channel_post', ('channel_post', 'edited_channel_post')),
+                                 ('handle_inline_query', ('inline_query',)),
+                                 ('handle_chosen_inline_result', ('chosen_inline_result',)),
+                                 ('handle_callback_query', ('callback_query',)),
+                                 ('handle_shipping_query', ('shipping_query',)),
+                                 ('handle_pre_checkout_query', ('pre_checkout_query',))):
+            if overrides(hook):
+                kinds.update(hook_kinds)
+
+        # Nothing is handled, but an empty list would subscribe to all kinds
+        return [k for k in types.Update.KINDS if k in kinds] or ['message']
+
     def __init__(self, token: str):
         """Init
         """
@@ -28,7 +156,9 @@ class Bot:
         self._sender = None  # type: types.User
         self._chat = None  # type: types.Chat
         self._last_message_id = None  # type: int
-        self._command_aliases = {}
+        self._command_args = []  # type: List[str]
+        self._priority = None  # type: Optional[int]
+        self._deadline = None  # type: Optional[float]
 
     @property
     def token(self) -> str:
@@ -101,11 +231,52 @@ class Bot:
         """
         return _cache_pool.get_hash('{}.{}'.format(self._id, self.chat.id))
 
-    def set_command_alias(self, command: str, alias: str):
-        if alias in self._command_aliases:
-            raise ValueError("Command alias '{}' already defined")
+    @property
+    def command_args(self) -> List[str]:
+        """Get arguments of the command being called
+        """
+        return self._command_args
 
-        self._command_aliases[alias] = command
+    @classmethod
+    def register_command(cls, name: str, handler: Callable):
+        """Register a command handler
+        """
+        cls._commands[name] = handler
+
+    @classmethod
+    def set_command_alias(cls, command: str, alias: str):
+        """Set a command alias
+        """
+        if cls._command_aliases.get(alias, command) != command:
+            raise ValueError("Command alias '{}' already defined".format(alias))
+
+        cls._command_aliases[alias] = command
+
+    def parse_command(self, msg: types.Message) -> Optional[Tuple[str, List[str]]]:
+        """Extract command's name and arguments from a message
+        """
+        text = msg.text
+        if not text:
+            return None
+
+        if text in self._command_aliases:
+            return self._command_aliases[text], []
+
+        if msg.entities:
+            entity = msg.entities[0]
+            if entity.type != 'bot_command' or entity.offset != 0:
+                return None
+            cmd = text[:entity.length]
+        elif text.startswith('/'):
+            cmd = text.split(maxsplit=1)[0]
+        else:
+            return None
+
+        name, _, target = cmd[1:].partition('@')
+        if target and target.lower() != (self.username or '').lower():
+            return None
+
+        return self._command_aliases.get(name, name), text[len(cmd):].split()
 
     def get_var(self, key: str, default=None):
         """Get a value of a state variable
@@ -147,12 +318,44 @@ class Bot:
     def process_update(self, update: types.Update):
         """Process incoming update from Telegram
         """
+        sink = _metrics.get_sink()
+        start = _monotonic() if sink else None
+        profile = _profiler.start(_metrics.bot_label(self._token), update.update_id, update.kind)
+        task = _watchdog.watch(_metrics.bot_label(self._token), update.update_id, update.kind)
+
+        try:
+            chain = _middleware.get_chain(self)
+            if chain:
+                return _middleware.run(chain, 'process_update', self.dispatch_update, 'dispatch_update', self, update)
+
+            return self.dispatch_update(update)
+
+        finally:
+            if task:
+                _watchdog.unwatch(task)
+
+            if profile:
+                _profiler.stop(profile)
+
+            if sink:
+                labels = {'bot': _metrics.bot_label(self._token), 'kind': update.kind}
+                sink.inc('telegram_updates_total', 1, labels)
+                sink.observe('telegram_update_duration_seconds', _monotonic() - start, labels)
+
+    def dispatch_update(self, update: types.Update):
+        """Dispatch incoming update to an appropriate hook
+        """
         if update.message or update.edited_message:
             message = update.message or update.edited_message
             self._sender = message.sender
             self._chat = message.chat
             self._last_message_id = message.message_id
-            self._process_private_message(message)
+            if isinstance(update, _MediaGroupUpdate):
+                self._process_media_group(update.media_group)
+            elif update.message and message.media_group_id and self._aggregates_media_groups():
+                self._buffer_media_group(update.update_id, message)
+            else:
+                self._process_private_message(message)
 
         elif update.channel_post or update.edited_channel_post:
             post = update.channel_post or update.edited_channel_post
@@ -173,6 +376,8 @@ class Bot:
             self._sender = update.callback_query.sender
             if update.callback_query.message:
                 self._chat = update.callback_query.message.chat
+            if _callback_data.is_token(update.callback_query.data):
+                update.callback_query.data = _callback_data.resolve(update.callback_query.data)
             self._process_callback_query(update.callback_query)
 
         elif update.shipping_query:
@@ -186,24 +391,85 @@ class Bot:
         else:
             raise RuntimeError("Unsupported update request from telegram: {}".format(update))
 
-    def _request(self, endpoint: str, params: dict = None, data: dict = None, method: str = 'GET'):
+    @contextmanager
+    def priority(self, priority: int, deadline: float = None):
+        """Set priority class and deadline, in seconds, of API calls made within the context
+        """
+        prev = self._priority, self._deadline
+        self._priority, self._deadline = priority, deadline
+        try:
+            yield self
+        finally:
+            self._priority, self._deadline = prev
+
+    def _request(self, endpoint: str, params: dict = None, data: dict = None, method: str = 'GET',
+                 files: Dict[str, types.InputFile] = None, body: bytes = None):
         """Perform a request to the Telegram API
         """
-        return _api.request(self._token, endpoint, params, data, method)
+        profile = _profiler.current()
+        start = _monotonic() if profile else None
+        err = None
+
+        deadline, timeout = self._deadline, None
+        task = _watchdog.current()
+
+        try:
+            # Calls of an update which has exceeded its deadline are cancelled; the rest may not outlive the deadline
+            if task and reg.get('telegram.update_deadline_cancel', False):
+                if task.overdue or task.remaining <= 0:
+                    raise error.UpdateDeadlineExceeded(task.update_id, endpoint)
+                timeout = min(task.remaining, reg.get('telegram.request_timeout', 30))
+                deadline = min(deadline, timeout) if deadline else timeout
+
+            chain = _middleware.get_chain(self)
+            if chain:
+                return _middleware.run(chain, 'request', self._perform_request, 'request', self,
+                                       _middleware.ApiCall(endpoint, params, data, method, self._priority,
+                                                           deadline, files, body, timeout))
+
+            return _api.request(self._token, endpoint, params, data, method, self._priority, deadline, files, body,
+                                timeout)
+
+        except _requests.exceptions.Timeout as e:
+            err = e
+            # Timeout is only set from the update's deadline
+            if timeout is not None and task.remaining <= 0:
+                raise error.UpdateDeadlineExceeded(task.update_id, endpoint) from e
+            raise
+
+        except Exception as e:
+            err = e
+            raise
+
+        finally:
+            if profile:
+                profile.add_call(endpoint, start, _monotonic(), err)
+
+    def _perform_request(self, call: _middleware.ApiCall):
+        """Perform an API call passed through the middleware chain
+        """
+        return _api.request(self._token, call.endpoint, call.params, call.data, call.method, call.priority,
+                            call.deadline, call.files, call.body, call.timeout)
+
+    def _count_retry(self, endpoint: str):
+        """Count a repeated API call in metrics
+        """
+        sink = _metrics.get_sink()
+        if sink:
+            sink.inc('telegram_api_retries_total', 1, {'bot': _metrics.bot_label(self._token), 'endpoint': endpoint})
+
+    def _call(self, endpoint: _endpoint.Endpoint, *values):
+        """Perform a request to the Telegram API, sending parameters' values as a JSON body
+        """
+        return self._request(endpoint.name, method='POST', body=endpoint.encode(*values))
 
     def _process_private_message(self, msg: types.Message):
         """Process an incoming private message
         """
         # New command received
-        if msg.text and (msg.text.startswith('/') or msg.text in self._command_aliases):
-            if msg.text.startswith('/'):
-                cmd_name = msg.text[1:].split(' ')[0]
-                if cmd_name in self._command_aliases:
-                    self.call_command(self._command_aliases[cmd_name], msg, 0)
-                else:
-                    self.call_command(cmd_name, msg, 0)
-            else:
-                self.call_command(self._command_aliases[msg.text], msg, 0)
+        command = self.parse_command(msg)
+        if command:
+            self.call_command(command[0], msg, 0, command[1])
 
         # Simple message received
         else:
@@ -215,7 +481,96 @@ class Bot:
             else:
                 self.handle_private_message(msg)
 
+    def _aggregates_media_groups(self) -> bool:
+        """Check whether album messages should be aggregated before handling
+        """
+        return type(self).handle_media_group is not Bot.handle_media_group and \
+            reg.get('telegram.media_group_window', 1.0) > 0
+
+    def _buffer_media_group(self, update_id: int, msg: types.Message):
+        """Buffer a message of an album
+
+        The first buffered message of an album schedules delivery of the whole album to `handle_media_group()`.
+        Messages are buffered in memory of the current process, so an album is aggregated only if all its updates
+        are received by the same process. That is the case when updates are processed by worker processes sharded by
+        chat ID, see the `telegram.workers` registry parameter.
+        """
+        key = '{}.{}'.format(self._id, msg.media_group_id)
+
+        with _media_groups_lock:
+            if key in _media_groups:
+                last_update_id, items = _media_groups[key]
+                items[msg.message_id] = msg.raw
+                _media_groups[key] = (max(last_update_id, update_id), items)
+                return
+
+            _media_groups[key] = (update_id, {msg.message_id: msg.raw})
+
+        timer = _threading.Timer(reg.get('telegram.media_group_window', 1.0), self._flush_media_group, (key,))
+        timer.daemon = True
+        timer.start()
+
+    def _flush_media_group(self, key: str):
+        """Deliver buffered messages of an album
+
+        The album is processed as an update with ID of its last message's update, so it passes through the same
+        middleware, metrics, watchdog and profiler as other updates.
+        """
+        with _media_groups_lock:
+            update_id, items = _media_groups.pop(key)
+
+        try:
+            self.process_update(_MediaGroupUpdate(update_id, types.MediaGroup(list(items.values()))))
+
+        except Exception as e:
+            logger.error(e)
+
+    def _process_media_group(self, group: types.MediaGroup):
+        try:
+            self.handle_media_group(group)
+
+        except error.CommandExecutionError as e:
+            logger.error(e)
+            self.send_message(e.msg, reply_markup=e.reply_markup)
+
+    def _is_repeated_callback_query(self, query: types.CallbackQuery) -> bool:
+        """Check whether the same button of the same message has been already tapped within debounce window
+
+        Taps are remembered in memory of the current process, so repeated taps are detected only if they are received
+        by the same process. That is the case when updates are processed by worker processes sharded by chat ID, see
+        the `telegram.workers` registry parameter.
+        """
+        window = reg.get('telegram.callback_query_debounce', 0)
+        if not window:
+            return False
+
+        if query.message:
+            msg_key = '{}.{}'.format(query.message.chat.id, query.message.message_id)
+        else:
+            msg_key = query.inline_message_id
+        key = '{}.{}.{}'.format(self._id, msg_key, util.md5_hex_digest(query.data or ''))
+        now = _monotonic()
+
+        with _callback_queries_lock:
+            # Taps are stored in order they are received, so expired ones are at the beginning
+            while _callback_queries:
+                k, expires = next(iter(_callback_queries.items()))
+                if expires > now:
+                    break
+                del _callback_queries[k]
+
+            if key in _callback_queries:
+                return True
+            _callback_queries[key] = now + window
+
+        return False
+
     def _process_callback_query(self, query: types.CallbackQuery):
+        # Rapid repeated taps are answered without calling handlers
+        if self._is_repeated_callback_query(query):
+            self.answer_callback_query(query.id)
+            return
+
         # Try to restore current command from state
         if self.command_name:
             self.call_command(self.command_name, query)
@@ -230,17 +585,20 @@ class Bot:
 
         return self
 
-    def call_command(self, name: str, msg: Union[types.Message, types.CallbackQuery], step: int = None):
+    def call_command(self, name: str, msg: Union[types.Message, types.CallbackQuery], step: int = None,
+                     args: List[str] = None):
         """Process an incoming command
         """
         self.command_name = name
         if step is not None:
             self.command_step = step
+        if args is not None:
+            self._command_args = args
 
         try:
-            cmd_method = 'cmd_{}'.format(name)
-            if hasattr(self, cmd_method):
-                getattr(self, cmd_method)(msg)
+            handler = self._commands.get(name)
+            if handler:
+                handler(self, msg)
             else:
                 self.handle_command(name, msg)
 
@@ -253,6 +611,14 @@ class Bot:
         """
         logger.debug('{}: Private message received: {}'.format(self.__class__, msg))
 
+    def handle_media_group(self, group: types.MediaGroup):
+        """Hook
+
+        Being overridden, enables aggregation of album messages, which are delivered here instead of separate calls
+        to `handle_private_message()`.
+        """
+        logger.debug('{}: Media group received: {}'.format(self.__class__, group))
+
     def handle_command(self, name: str, msg: Union[types.Message, types.CallbackQuery]):
         """Hook
         """
@@ -293,12 +659,16 @@ class Bot:
     def get_me(self) -> types.User:
         """A simple method for testing bot's auth token
 
+        Bot's identity is requested once per token and process, because bots are instantiated for every update.
+
         https://core.telegram.org/bots/api#getme
         """
         if self._me:
             return self._me
 
-        self._me = types.User(self._request('getMe'))
+        self._me = _identities.get(self._token)
+        if self._me is None:
+            self._me = _identities[self._token] = types.User(self._request('getMe'))
 
         return self._me
 
@@ -312,20 +682,33 @@ class Bot:
         if parse_mode not in ('HTML', 'Markdown'):
             parse_mode = 'HTML'
 
-        msg = types.Message(self._request('sendMessage', {
-            'chat_id': chat_id or self.chat.id,
-            'text': text,
-            'parse_mode': parse_mode,
-            'disable_web_page_preview': disable_web_page_preview,
-            'disable_notification': disable_notification,
-            'reply_to_message_id': reply_to_message_id,
-            'reply_markup': json.dumps(reply_markup.as_jsonable()) if reply_markup else '',
-        }))
+        msg = types.Message(self._call(_SEND_MESSAGE, chat_id or self.chat.id, text, parse_mode,
+                                       disable_web_page_preview, disable_notification, reply_to_message_id,
+                                       reply_markup))
 
         self._last_message_id = msg.message_id
 
         return msg
 
+    def queue_message(self, text: str, chat_id: Union[int, str] = None, parse_mode: str = 'HTML',
+                      disable_web_page_preview: bool = False, disable_notification: bool = False,
+                      reply_to_message_id: int = None, reply_markup: ReplyMarkup = None, key: str = None) -> str:
+        """Enqueue text message into the durable outbox, which sends it in background
+
+        Messages enqueued with the same `key` are sent once. Returns the key, see `outbox_status()`.
+        """
+        if parse_mode not in ('HTML', 'Markdown'):
+            parse_mode = 'HTML'
+
+        return _outbox.get_outbox().put(_api.bot_uid(self._token), _SEND_MESSAGE.name, _SEND_MESSAGE.encode(
+            chat_id or self.chat.id, text, parse_mode, disable_web_page_preview, disable_notification,
+            reply_to_message_id, reply_markup), key)
+
+    def outbox_status(self, key: str) -> Optional[dict]:
+        """Get delivery status of a message enqueued into the outbox
+        """
+        return _outbox.get_outbox().status(_api.bot_uid(self._token), key)
+
     def edit_message_text(self, text: str, chat_id: Union[int, str] = None, message_id: int = None,
                           inline_message_id: str = None, parse_mode: str = 'HTML',
                           disable_web_page_preview: bool = False,
@@ -338,15 +721,8 @@ class Bot:
         if parse_mode not in ('HTML', 'Markdown'):
             parse_mode = 'HTML'
 
-        return types.Message(self._request('editMessageText', {
-            'text': text,
-            'chat_id': chat_id,
-            'message_id': message_id,
-            'inline_message_id': inline_message_id,
-            'parse_mode': parse_mode,
-            'disable_web_page_preview': disable_web_page_preview,
-            'reply_markup': json.dumps(reply_markup.as_jsonable()) if reply_markup else '',
-        }))
+        return types.Message(self._call(_EDIT_MESSAGE_TEXT, text, chat_id, message_id, inline_message_id, parse_mode,
+                                        disable_web_page_preview, reply_markup))
 
     def edit_message_caption(self, caption: str = None, chat_id: Union[int, str] = None, message_id: int = None,
                              inline_message_id: str = None, reply_markup: ReplyMarkup = None):
@@ -354,13 +730,7 @@ class Bot:
 
         https://core.telegram.org/bots/api#editmessagecaption
         """
-        return self._request('editMessageCaption', {
-            'caption': caption,
-            'chat_id': chat_id,
-            'message_id': message_id,
-            'inline_message_id': inline_message_id,
-            'reply_markup': json.dumps(reply_markup.as_jsonable()) if reply_markup else '',
-        })
+        return self._call(_EDIT_MESSAGE_CAPTION, caption, chat_id, message_id, inline_message_id, reply_markup)
 
     def edit_message_reply_markup(self, chat_id: Union[int, str] = None, message_id: int = None,
                                   inline_message_id: str = None, reply_markup: ReplyMarkup = None):
@@ -368,12 +738,7 @@ class Bot:
 
         https://core.telegram.org/bots/api#editmessagereplymarkup
         """
-        return self._request('editMessageReplyMarkup', {
-            'chat_id': chat_id,
-            'message_id': message_id,
-            'inline_message_id': inline_message_id,
-            'reply_markup': json.dumps(reply_markup.as_jsonable()) if reply_markup else '',
-        })
+        return self._call(_EDIT_MESSAGE_REPLY_MARKUP, chat_id, message_id, inline_message_id, reply_markup)
 
     def answer_callback_query(self, callback_query_id: str, text: str = None, show_alert: bool = False, url: str = None,
                               cache_time: int = 0):
@@ -381,43 +746,218 @@ class Bot:
 
         https://core.telegram.org/bots/api#answercallbackquery
         """
-        return self._request('answerCallbackQuery', {
-            'callback_query_id': callback_query_id,
-            'text': text,
-            'show_alert': show_alert,
-            'url': url,
-            'cache_time': cache_time,
-        })
+        return self._call(_ANSWER_CALLBACK_QUERY, callback_query_id, text, show_alert, url, cache_time)
+
+    def answer_pre_checkout_query(self, pre_checkout_query_id: str, ok: bool, error_message: str = None):
+        """Respond to a pre-checkout query
+
+        https://core.telegram.org/bots/api#answerprecheckoutquery
+        """
+        return self._call(_ANSWER_PRE_CHECKOUT_QUERY, pre_checkout_query_id, ok, error_message)
+
+    def answer_inline_query(self, inline_query_id: str, results: Union[List[types.InlineQueryResult], str],
+                            cache_time: int = 300, is_personal: bool = False, next_offset: str = '',
+                            switch_pm_text: str = None, switch_pm_parameter: str = None):
+        """Send answers to an inline query
+
+        `results` may be a list of results or a JSON string of already serialized ones.
+
+        https://core.telegram.org/bots/api#answerinlinequery
+        """
+        if not isinstance(results, str):
+            results = json.dumps([r.as_jsonable() for r in results], separators=(',', ':'))
+
+        return self._call(_ANSWER_INLINE_QUERY, inline_query_id, results, cache_time, is_personal, next_offset,
+                          switch_pm_text, switch_pm_parameter)
+
+    def answer_inline_query_cached(self, query: types.InlineQuery,
+                                   builder: Callable[[str], Iterable[types.InlineQueryResult]],
+                                   page_size: int = inline.MAX_RESULTS, is_personal: bool = False,
+                                   cache_ttl: int = None, cache_time: int = 300):
+        """Answer an inline query page by page, caching serialized pages
+
+        `builder` is called with the query's text on cache miss and may return a lazy iterable, which is consumed only
+        up to the end of the requested page. Pages are cached by query's text, offset and, if `is_personal` is set, by
+        the user.
+        """
+        scope = self.sender.id if is_personal else '*'
+        key = '{}.{}.{}.{}'.format(self._id, scope, query.offset, util.md5_hex_digest(query.query))
+
+        try:
+            results, next_offset = _inline_results_pool.get(key)
+        except cache.error.KeyNotExist:
+            page, next_offset = inline.paginate(builder(query.query), query.offset, page_size)
+            results = json.dumps([r.as_jsonable() for r in page], separators=(',', ':'))
+            if cache_ttl is None:
+                cache_ttl = reg.get('telegram.inline_results_ttl', 300)
+            _inline_results_pool.put(key, [results, next_offset], cache_ttl)
+
+        return self.answer_inline_query(query.id, results, cache_time, is_personal, next_offset)
 
     def delete_message(self, chat_id: Union[int, str], message_id: int):
         """Delete a message
 
         https://core.telegram.org/bots/api#deletemessage
         """
-        return self._request('deleteMessage', {
-            'chat_id': chat_id or self.chat.id,
-            'message_id': message_id,
-        })
+        return self._call(_DELETE_MESSAGE, chat_id or self.chat.id, message_id)
 
-    def send_photo(self, photo_file_id: str, chat_id: Union[int, str] = None, caption: str = None,
+    def _file_id_key(self, field: str, upload: types.InputFile) -> Optional[str]:
+        """Get a key of an uploaded file's ID in the file IDs storage
+        """
+        digest = upload.digest
+        if digest:
+            return '{}.{}.{}'.format(util.md5_hex_digest(self._token), field, digest)
+
+    @staticmethod
+    def _media_file_id(msg: types.Message, field: str) -> Optional[str]:
+        """Get ID of a media file in a sent message
+        """
+        if field == 'photo':
+            return msg.photo[-1].file_id if msg.photo else None
+
+        media = getattr(msg, field, None)
+
+        return media.file_id if media else None
+
+    def _send_media(self, endpoint: _endpoint.Endpoint, media, *values) -> types.Message:
+        """Send a media file
+
+        `media` is the value of the endpoint's first parameter. A string is a file ID or an URL, anything else
+        acceptable by `types.InputFile` is uploaded, local files must be given as `os.PathLike`. Files are uploaded
+        only if the same content has not been uploaded before, otherwise its file ID is reused.
+        """
+        field = endpoint.fields[0]
+        upload = types.InputFile.wrap(media)
+        store = file_ids.get_store() if upload else None
+        key = self._file_id_key(field, upload) if store is not None else None
+
+        if upload and key:
+            file_id = store.get(key)
+            if file_id:
+                try:
+                    return self._send_media(endpoint, file_id, *values)
+                except error.ApiRequestError as e:
+                    logger.warn('Cannot reuse file ID {}, uploading again: {}'.format(file_id, e))
+                    self._count_retry(endpoint.name)
+
+        if upload:
+            msg = types.Message(self._request(endpoint.name, endpoint.as_dict(None, *values), method='POST',
+                                              files={field: upload}))
+            if store is not None:
+                key = key or self._file_id_key(field, upload)
+                file_id = self._media_file_id(msg, field)
+                if key and file_id:
+                    store.put(key, file_id)
+        else:
+            msg = types.Message(self._call(endpoint, media, *values))
+
+        self._last_message_id = msg.message_id
+
+        return msg
+
+    def send_photo(self, photo, chat_id: Union[int, str] = None, caption: str = None,
                    disable_notification: bool = None, reply_to_message_id: int = None,
                    reply_markup: ReplyMarkup = None) -> types.Message:
         """Send a photo
 
         https://core.telegram.org/bots/api#sendphoto
         """
-        msg = types.Message(self._request('sendPhoto', {
-            'chat_id': chat_id or self.chat.id,
-            'photo': photo_file_id,
-            'caption': caption,
-            'disable_notification': disable_notification,
-            'reply_to_message_id': reply_to_message_id,
-            'reply_markup': json.dumps(reply_markup.as_jsonable()) if reply_markup else '',
-        }))
+        return self._send_media(_SEND_PHOTO, photo, chat_id or self.chat.id, caption, disable_notification,
+                                reply_to_message_id, reply_markup)
 
-        self._last_message_id = msg.message_id
+    def send_document(self, document, chat_id: Union[int, str] = None, caption: str = None,
+                      disable_notification: bool = None, reply_to_message_id: int = None,
+                      reply_markup: ReplyMarkup = None) -> types.Message:
+        """Send a general file
 
-        return msg
+        https://core.telegram.org/bots/api#senddocument
+        """
+        return self._send_media(_SEND_DOCUMENT, document, chat_id or self.chat.id, caption, disable_notification,
+                                reply_to_message_id, reply_markup)
+
+    def send_video(self, video, chat_id: Union[int, str] = None, duration: int = None, width: int = None,
+                   height: int = None, caption: str = None, supports_streaming: bool = None,
+                   disable_notification: bool = None, reply_to_message_id: int = None,
+                   reply_markup: ReplyMarkup = None) -> types.Message:
+        """Send a video
+
+        https://core.telegram.org/bots/api#sendvideo
+        """
+        return self._send_media(_SEND_VIDEO, video, chat_id or self.chat.id, duration, width, height, caption,
+                                supports_streaming, disable_notification, reply_to_message_id, reply_markup)
+
+    def send_audio(self, audio, chat_id: Union[int, str] = None, caption: str = None, duration: int = None,
+                   performer: str = None, title: str = None, disable_notification: bool = None,
+                   reply_to_message_id: int = None, reply_markup: ReplyMarkup = None) -> types.Message:
+        """Send an audio file
+
+        https://core.telegram.org/bots/api#sendaudio
+        """
+        return self._send_media(_SEND_AUDIO, audio, chat_id or self.chat.id, caption, duration, performer, title,
+                                disable_notification, reply_to_message_id, reply_markup)
+
+    def send_media_group(self, media: List[types.InputMedia], chat_id: Union[int, str] = None,
+                         disable_notification: bool = None, reply_to_message_id: int = None) -> types.MessageArray:
+        """Send a group of photos or videos as an album
+
+        Items may mix file IDs, URLs and files to be uploaded. As with other media sending methods, already uploaded
+        content is not uploaded again.
+
+        https://core.telegram.org/bots/api#sendmediagroup
+        """
+        if not 2 <= len(media) <= 10:
+            raise ValueError('Media group must include 2-10 items')
+
+        store = file_ids.get_store()
+        reuse_file_ids = store is not None
+
+        while True:
+            items, files, reused = [], {}, False
+            for i, item in enumerate(media):
+                upload = item.input_file
+                if not upload:
+                    items.append(item.as_jsonable())
+                    continue
+
+                key = self._file_id_key(item.type, upload) if reuse_file_ids else None
+                file_id = store.get(key) if key else None
+                if file_id:
+                    items.append(item.as_jsonable(file_id))
+                    reused = True
+                else:
+                    files['file{}'.format(i)] = upload
+                    items.append(item.as_jsonable('attach://file{}'.format(i)))
+
+            values = (chat_id or self.chat.id, items, disable_notification, reply_to_message_id)
+
+            try:
+                if files:
+                    msgs = types.MessageArray(self._request(_SEND_MEDIA_GROUP.name, _SEND_MEDIA_GROUP.as_dict(*values),
+                                                            method='POST', files=files))
+                else:
+                    msgs = types.MessageArray(self._call(_SEND_MEDIA_GROUP, *values))
+                break
+
+            except error.ApiRequestError as e:
+                # Files read by the failed attempt must be rewound, which is impossible for one-shot sources
+                if not reused or not all(f.rewind() for f in files.values()):
+                    raise e
+                logger.warn('Cannot send media group reusing file IDs, uploading again: {}'.format(e))
+                self._count_retry(_SEND_MEDIA_GROUP.name)
+                reuse_file_ids = False
+
+        if store is not None:
+            for item, msg in zip(media, msgs):
+                if item.input_file:
+                    key = self._file_id_key(item.type, item.input_file)
+                    file_id = self._media_file_id(msg, item.type)
+                    if key and file_id:
+                        store.put(key, file_id)
+
+        if len(msgs):
+            self._last_message_id = msgs[-1].message_id
+
+        return msgs
 
     @staticmethod
     def _sanitize_chat_id(chat_id: Union[int, str]) -> Union[int, str]:
@@ -491,13 +1031,99 @@ class Bot:
             return False
 
     def get_file(self, file_id: str) -> types.File:
+        """Get basic info about a file and prepare it for downloading
+
+        Results are cached for the `telegram.file_cache_ttl` registry parameter's seconds, which should be less than
+        lifetime of download links. Concurrent calls for the same file are coalesced into one request.
+
+        https://core.telegram.org/bots/api#getfile
+        """
+        key = '{}.{}'.format(util.md5_hex_digest(self._token), file_id)
+
+        try:
+            return types.File(_files_pool.get(key))
+        except cache.error.KeyNotExist:
+            pass
+
+        with _files_lock:
+            pending = _files_pending.get(key)
+            is_leader = pending is None
+            if is_leader:
+                pending = _files_pending[key] = _PendingCall()
+
+        if not is_leader:
+            pending.done.wait()
+            if pending.error:
+                raise pending.error
+            return types.File(pending.result)
+
         try:
-            return types.File(self._request('getFile', {
+            pending.result = self._request('getFile', {
                 'file_id': file_id,
-            }))
+            })
+            _files_pool.put(key, pending.result, reg.get('telegram.file_cache_ttl', 3000))
+
+            return types.File(pending.result)
+
         except error.ApiRequestError as e:
             logger.error(e)
-            raise error.FileNotFound(file_id)
+            pending.error = error.FileNotFound(file_id)
+            raise pending.error
+
+        except Exception as e:
+            pending.error = e
+            raise e
+
+        finally:
+            with _files_lock:
+                del _files_pending[key]
+            pending.done.set()
 
     def get_file_url(self, file: types.File) -> str:
-        return 'https://api.telegram.org/file/bot{}/{}'.format(self._token, file.file_path)
+        return '{}/file/bot{}/{}'.format(_api.api_url(), self._token, file.file_path)
+
+    def iter_file(self, file: Union[types.File, str], chunk_size: int = 65536,
+                  max_size: int = None) -> Iterator[bytes]:
+        """Download a file chunk by chunk
+
+        `file` may be a file object or a file ID. If `max_size` is not specified, the `telegram.max_download_size`
+        registry parameter is used.
+        """
+        if isinstance(file, str):
+            file = self.get_file(file)
+
+        if max_size is None:
+            max_size = reg.get('telegram.max_download_size', 20971520)
+
+        if max_size and file.file_size and file.file_size > max_size:
+            raise error.FileTooLarge(file.file_path, max_size)
+
+        return _api.iter_download(self.get_file_url(file), chunk_size, max_size)
+
+    def download_file(self, file: Union[types.File, str], dest: Union[str, BinaryIO], chunk_size: int = 65536,
+                      max_size: int = None) -> int:
+        """Download a file to a path or to a writable object
+
+        Returns number of written bytes. Downloading to a path is performed via a temporary file, so an incomplete
+        file never appears at `dest`.
+        """
+        if not isinstance(dest, str):
+            size = 0
+            for chunk in self.iter_file(file, chunk_size, max_size):
+                dest.write(chunk)
+                size += len(chunk)
+
+            return size
+
+        tmp_path = dest + '.part'
+        try:
+            with open(tmp_path, 'wb') as f:
+                size = self.download_file(file, f, chunk_size, max_size)
+            os.replace(tmp_path, dest)
+
+            return size
+
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
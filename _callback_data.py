@@ -0,0 +1,58 @@
+"""PytSite Telegram Server-side Callback Data Storage
+"""
+__author__ = 'Oleksandr Shepetko'
+__email__ = 'a@shepetko.com'
+__license__ = 'MIT'
+
+from typing import Optional
+from pytsite import cache, reg, util
+
+# Maximum length of callback data allowed by Telegram, in bytes
+MAX_LENGTH = 64
+
+_TOKEN_PREFIX = '#~'
+
+_pool = cache.create_pool('telegram.callback_data')
+
+
+def pack(inline_keyboard: list) -> list:
+    """Replace callback data exceeding allowed length with short tokens
+
+    Payloads of all buttons of a keyboard are stored at once, for the `telegram.callback_data_ttl` registry
+    parameter's seconds. A new JSONable keyboard is returned, the original one stays intact.
+    """
+    key = None
+    payloads = {}
+    rows = []
+
+    for row in inline_keyboard:
+        new_row = []
+        for btn in row:
+            data = btn.get('callback_data')
+            if data and len(data.encode('utf-8')) > MAX_LENGTH:
+                key = key or util.random_str(16)
+                idx = str(len(payloads))
+                payloads[idx] = data
+                btn = dict(btn, callback_data='{}{}.{}'.format(_TOKEN_PREFIX, key, idx))
+            new_row.append(btn)
+        rows.append(new_row)
+
+    if payloads:
+        _pool.put_hash(key, payloads, reg.get('telegram.callback_data_ttl', 172800))
+
+    return rows
+
+
+def is_token(data: Optional[str]) -> bool:
+    return bool(data) and data.startswith(_TOKEN_PREFIX)
+
+
+def resolve(token: str) -> Optional[str]:
+    """Get callback data stored under a token, or None if it has expired
+    """
+    key, _, idx = token[len(_TOKEN_PREFIX):].partition('.')
+
+    try:
+        return _pool.get_hash_item(key, idx)
+    except cache.error.KeyNotExist:
+        return None
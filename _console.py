@@ -0,0 +1,90 @@
+"""PytSite Telegram Plugin Console Commands
+"""
+__author__ = 'Oleksandr Shepetko'
+__email__ = 'a@shepetko.com'
+__license__ = 'MIT'
+
+from pytsite import console, reg
+from . import _replay, _fake_server
+
+
+class Replay(console.Command):
+    """Replay Recorded Updates Command
+    """
+
+    def __init__(self):
+        super().__init__()
+
+        self.define_option(console.option.Str('speed', default='1'))
+        self.define_option(console.option.Int('threads', default=8))
+        self.define_option(console.option.Bool('live'))
+
+    @property
+    def name(self) -> str:
+        return 'telegram:replay'
+
+    @property
+    def description(self) -> str:
+        return 'telegram@console_command_description_replay'
+
+    def exec(self):
+        paths = self.args or [reg.get('telegram.record_dir')]
+        if not paths[0]:
+            raise console.error.CommandExecutionError('Path to recorded updates is not specified')
+
+        try:
+            speed = float(self.opt('speed'))
+        except ValueError:
+            raise console.error.CommandExecutionError('Invalid speed: {}'.format(self.opt('speed')))
+
+        if not self.opt('live'):
+            console.print_info('Outbound API calls are answered by a stub')
+
+        stats = _replay.replay(paths, speed, self.opt('threads'), not self.opt('live'))
+
+        console.print_success('{} updates processed, {} failed in {:.3f}s, {:.1f} updates/s'.format(
+            stats.processed, stats.failed, stats.duration, stats.throughput))
+        console.print_info('Latency: p50 {:.4f}s, p90 {:.4f}s, p99 {:.4f}s, max {:.4f}s'.format(
+            stats.percentile(50), stats.percentile(90), stats.percentile(99), stats.percentile(100)))
+
+
+class FakeServer(console.Command):
+    """Run Fake Telegram Bot API Server Command
+    """
+
+    def __init__(self):
+        super().__init__()
+
+        self.define_option(console.option.Str('host', default='127.0.0.1'))
+        self.define_option(console.option.Int('port', default=8081))
+        self.define_option(console.option.Str('latency', default='0'))
+        self.define_option(console.option.Str('jitter', default='0'))
+        self.define_option(console.option.Str('rate-429', default='0'))
+        self.define_option(console.option.Str('error-rate', default='0'))
+
+    @property
+    def name(self) -> str:
+        return 'telegram:fake-server'
+
+    @property
+    def description(self) -> str:
+        return 'telegram@console_command_description_fake_server'
+
+    def exec(self):
+        try:
+            opts = {k: float(self.opt(k)) for k in ('latency', 'jitter', 'rate-429', 'error-rate')}
+        except ValueError as e:
+            raise console.error.CommandExecutionError(e)
+
+        srv = _fake_server.FakeServer(self.opt('host'), self.opt('port'), opts['latency'], opts['jitter'],
+                                      opts['rate-429'], opts['error-rate'])
+        console.print_info("Serving at {}, set the 'telegram.api_url' registry parameter to use it".format(srv.url))
+
+        try:
+            srv.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            srv.server_close()
+            console.print_info('Calls served: {}'.format(', '.join('{}: {}'.format(k, v)
+                                                                   for k, v in sorted(srv.calls.items()))))
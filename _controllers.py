@@ -5,8 +5,8 @@ __email__ = 'a@shepetko.com'
 __license__ = 'MIT'
 
 import json
-from pytsite import routing, logger
-from . import _api, types, error
+from pytsite import routing, logger, reg, http
+from . import _admission, _api, _workers, _recorder, types, error, metrics
 
 
 class PostHook(routing.Controller):
@@ -15,8 +15,49 @@ class PostHook(routing.Controller):
 
     def exec(self):
         try:
-            _api.dispense_bot(self.arg('bot_uid')).process_update(types.Update(json.loads(self.request.data)))
+            data = json.loads(self.request.data)
+            update = types.Update(data)
+
+            # Multi-process mode
+            workers = reg.get('telegram.workers', 0)
+            pool = _workers.get_pool(workers) if workers else None
+            verdict = _admission.enter(update.kind, pool.pending) if pool else _admission.enter(update.kind)
+
+            # Deferred updates are delivered by Telegram again, so they are recorded only once, when admitted or dropped
+            if verdict == _admission.DEFERRED:
+                return self._retry_later()
+            _recorder.record(self.arg('bot_uid'), data)
+            if verdict == _admission.DROPPED:
+                return
+
+            if pool:
+                pool.submit(self.arg('bot_uid'), data)
+                return
+
+            try:
+                _api.dispense_bot(self.arg('bot_uid')).process_update(update)
+            finally:
+                _admission.leave()
+
         except error.BotNotRegistered as e:
             logger.warn(str(e))
         except Exception as e:
             logger.error(e)
+
+    @staticmethod
+    def _retry_later() -> http.Response:
+        """Ask Telegram to deliver an update again later
+        """
+        return http.Response('', 429, {'Retry-After': str(reg.get('telegram.shed_retry_after', 1))})
+
+
+class Metrics(routing.Controller):
+    """Prometheus Metrics Controller
+    """
+
+    def exec(self):
+        sink = metrics.get_sink()
+        if not isinstance(sink, metrics.PrometheusSink):
+            raise http.error.NotFound()
+
+        return http.Response(sink.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
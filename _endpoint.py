@@ -0,0 +1,56 @@
+"""PytSite Telegram API Endpoints Templates
+"""
+__author__ = 'Oleksandr Shepetko'
+__email__ = 'a@shepetko.com'
+__license__ = 'MIT'
+
+import json as _json
+from typing import Iterable, Tuple
+
+_json_encode = _json.JSONEncoder(ensure_ascii=False, separators=(',', ':')).encode
+
+
+class Endpoint:
+    """Precompiled Parameters Template of an API Endpoint
+
+    Encodes positional values of the endpoint's parameters straight into a compact JSON body, omitting None ones.
+    Values of raw parameters are either already encoded JSON strings or objects having `as_json()` method, like reply
+    markups, and are embedded as is.
+    """
+
+    def __init__(self, name: str, fields: Iterable[str], raw: Iterable[str] = ('reply_markup',)):
+        self._name = name
+        self._fields = tuple(fields)
+        raw = set(raw)
+        self._template = tuple(('"{}":'.format(f), f in raw) for f in self._fields)
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @property
+    def fields(self) -> Tuple[str, ...]:
+        return self._fields
+
+    def encode(self, *values) -> bytes:
+        """Encode parameters' values into a JSON body
+        """
+        parts = []
+        for (prefix, is_raw), value in zip(self._template, values):
+            if value is not None:
+                if is_raw:
+                    parts.append(prefix + (value if isinstance(value, str) else value.as_json()))
+                else:
+                    parts.append(prefix + _json_encode(value))
+
+        return ('{' + ','.join(parts) + '}').encode('utf-8')
+
+    def as_dict(self, *values) -> dict:
+        """Get parameters' values as a dict, e. g. to be sent as multipart form fields
+        """
+        r = {}
+        for field, (_, is_raw), value in zip(self._fields, self._template, values):
+            if value is not None:
+                r[field] = value.as_json() if is_raw and not isinstance(value, str) else value
+
+        return r
@@ -0,0 +1,102 @@
+"""PytSite Telegram Fake API Results
+"""
+__author__ = 'Oleksandr Shepetko'
+__email__ = 'a@shepetko.com'
+__license__ = 'MIT'
+
+import json
+import threading as _threading
+from itertools import count as _count
+from time import time as _time
+
+_message_ids = _count(1)
+_lock = _threading.Lock()
+
+FILE_SIZE = 1024
+
+FAKE_BOT = {'id': 1, 'is_bot': True, 'first_name': 'Fake Bot', 'username': 'fake_bot'}
+
+
+def _next_message_id() -> int:
+    with _lock:
+        return next(_message_ids)
+
+
+def _message(params: dict, **fields) -> dict:
+    chat_id = params.get('chat_id', 1)
+    try:
+        chat_id = int(chat_id)
+    except (TypeError, ValueError):
+        pass
+
+    msg = {
+        'message_id': _next_message_id(),
+        'from': FAKE_BOT,
+        'chat': {'id': chat_id, 'type': 'private'},
+        'date': int(_time()),
+    }
+    msg.update(fields)
+
+    return msg
+
+
+def _file(file_id: str) -> dict:
+    return {'file_id': file_id, 'file_size': FILE_SIZE, 'file_path': 'documents/{}'.format(file_id)}
+
+
+def parse_params(params: dict = None, data: dict = None, body: bytes = None) -> dict:
+    """Merge parameters of an API call passed as a query, a form or a JSON body
+    """
+    r = {}
+    if params:
+        r.update(params)
+    if data:
+        r.update(data)
+    if body:
+        r.update(json.loads(body.decode('utf-8') if isinstance(body, bytes) else body))
+
+    return r
+
+
+def result(endpoint: str, params: dict):
+    """Get a plausible result of an API call
+    """
+    if endpoint == 'getMe':
+        return FAKE_BOT
+
+    if endpoint == 'sendMessage':
+        return _message(params, text=params.get('text', ''))
+
+    if endpoint in ('editMessageText', 'editMessageCaption', 'editMessageReplyMarkup'):
+        if params.get('inline_message_id'):
+            return True
+        msg = _message(params, text=params.get('text', ''))
+        msg['message_id'] = params.get('message_id', msg['message_id'])
+        return msg
+
+    if endpoint == 'sendPhoto':
+        return _message(params, photo=[dict(_file('photo{}'.format(_next_message_id())), width=320, height=240)])
+
+    if endpoint in ('sendDocument', 'sendVideo', 'sendAudio'):
+        kind = endpoint[4:].lower()
+        return _message(params, **{kind: _file('{}{}'.format(kind, _next_message_id()))})
+
+    if endpoint == 'sendMediaGroup':
+        media = params.get('media', [])
+        if isinstance(media, str):
+            media = json.loads(media)
+        group_id = str(_next_message_id())
+        return [_message(params, media_group_id=group_id, photo=[dict(_file('photo{}'.format(i)), width=320,
+                                                                       height=240)]) for i in range(len(media))]
+
+    if endpoint == 'getFile':
+        return _file(params.get('file_id', 'file'))
+
+    if endpoint == 'getUpdates':
+        return []
+
+    if endpoint == 'getWebhookInfo':
+        return {'url': '', 'has_custom_certificate': False, 'pending_update_count': 0}
+
+    # answerCallbackQuery, answerInlineQuery, deleteMessage, setWebhook, deleteWebhook, etc.
+    return True
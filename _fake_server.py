@@ -0,0 +1,221 @@
+"""PytSite Telegram Fake Bot API Server
+"""
+__author__ = 'Oleksandr Shepetko'
+__email__ = 'a@shepetko.com'
+__license__ = 'MIT'
+
+import json
+import random as _random
+import threading as _threading
+from email.parser import BytesParser as _BytesParser
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from time import sleep as _sleep
+from typing import Dict, List
+from urllib.parse import urlsplit as _urlsplit, parse_qsl as _parse_qsl
+from . import _fake
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server = None  # type: FakeServer
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def _send(self, status: int, body: bytes, content_type: str = 'application/json', headers: dict = None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status: int, data: dict, headers: dict = None):
+        self._send(status, json.dumps(data, separators=(',', ':')).encode('utf-8'), headers=headers)
+
+    def _read_body(self) -> bytes:
+        """Read request body, decoding chunked transfer encoding, which is used for uploads of unknown size
+        """
+        if 'chunked' not in self.headers.get('Transfer-Encoding', '').lower():
+            length = int(self.headers.get('Content-Length') or 0)
+            return self.rfile.read(length) if length else b''
+
+        chunks = []
+        while True:
+            size = int(self.rfile.readline().split(b';', 1)[0].strip(), 16)
+            if not size:
+                break
+            chunks.append(self.rfile.read(size))
+            self.rfile.readline()
+
+        # Trailer section ends with an empty line
+        while self.rfile.readline() not in (b'\r\n', b'\n', b''):
+            pass
+
+        return b''.join(chunks)
+
+    def _read_params(self, query: str) -> dict:
+        params = dict(_parse_qsl(query))
+
+        body = self._read_body()
+        if not body:
+            return params
+
+        content_type = self.headers.get('Content-Type', '')
+        if content_type.startswith('application/json'):
+            params.update(json.loads(body.decode('utf-8')))
+        elif content_type.startswith('multipart/form-data'):
+            msg = _BytesParser().parsebytes(b'Content-Type: ' + content_type.encode('ascii') + b'\r\n\r\n' + body)
+            for part in msg.get_payload():
+                name = part.get_param('name', header='content-disposition')
+                if name and not part.get_filename():
+                    params[name] = part.get_payload(decode=True).decode('utf-8')
+        else:
+            params.update(_parse_qsl(body.decode('utf-8')))
+
+        return params
+
+    def _handle(self):
+        url = _urlsplit(self.path)
+        parts = url.path.strip('/').split('/', 2)
+        srv = self.server
+
+        if parts[0] == 'file' and len(parts) == 3 and parts[1].startswith('bot'):
+            return self._send_file()
+
+        if len(parts) != 2 or not parts[0].startswith('bot'):
+            self.close_connection = True
+            return self._send_json(404, {'ok': False, 'error_code': 404, 'description': 'Not Found'})
+
+        token, endpoint = parts[0][3:], parts[1]
+        params = self._read_params(url.query)
+        srv.count(endpoint)
+
+        srv.delay()
+
+        if srv.rate_429 and _random.random() < srv.rate_429:
+            return self._send_json(429, {
+                'ok': False,
+                'error_code': 429,
+                'description': 'Too Many Requests: retry after {}'.format(srv.retry_after),
+                'parameters': {'retry_after': srv.retry_after},
+            }, {'Retry-After': str(srv.retry_after)})
+
+        if srv.error_rate and _random.random() < srv.error_rate:
+            return self._send_json(500, {'ok': False, 'error_code': 500, 'description': 'Internal Server Error'})
+
+        self._send_json(200, {'ok': True, 'result': srv.result(token, endpoint, params)})
+
+    def _send_file(self):
+        srv = self.server
+        srv.count('file')
+        srv.delay()
+
+        size = srv.file_size
+        start = 0
+        status = 200
+        headers = {}
+        rng = self.headers.get('Range', '')
+        if rng.startswith('bytes='):
+            start = min(int(rng[6:].split('-')[0] or 0), size)
+            status = 206
+            headers['Content-Range'] = 'bytes {}-{}/{}'.format(start, size - 1, size)
+
+        self._send(status, bytes(i % 256 for i in range(start, size)), 'application/octet-stream', headers)
+
+    do_GET = do_POST = _handle
+
+
+class FakeServer(ThreadingMixIn, HTTPServer):
+    """Fake Telegram Bot API Server
+
+    Answers API calls with plausible results after `latency` seconds plus up to `jitter` seconds. A share of calls
+    defined by `rate_429` is rejected with HTTP 429 and a share defined by `error_rate` fails with HTTP 500. Files of
+    `file_size` bytes are served at `/file/bot<token>/<path>`. Point the `telegram.api_url` registry parameter to
+    `url` to make bots talk to the server.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 8081, latency: float = 0.0, jitter: float = 0.0,
+                 rate_429: float = 0.0, error_rate: float = 0.0, retry_after: int = 1,
+                 file_size: int = _fake.FILE_SIZE):
+        super().__init__((host, port), _Handler)
+
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_429 = rate_429
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.file_size = file_size
+        self.calls = {}  # type: Dict[str, int]
+        self._webhooks = {}  # type: Dict[str, dict]
+        self._updates = {}  # type: Dict[str, List[dict]]
+        self._lock = _threading.Lock()
+        self._thread = None  # type: _threading.Thread
+
+    @property
+    def url(self) -> str:
+        return 'http://{}:{}'.format(*self.server_address[:2])
+
+    def count(self, endpoint: str):
+        with self._lock:
+            self.calls[endpoint] = self.calls.get(endpoint, 0) + 1
+
+    def delay(self):
+        latency = self.latency + (_random.uniform(0, self.jitter) if self.jitter else 0)
+        if latency > 0:
+            _sleep(latency)
+
+    def push_update(self, bot_token: str, update: dict):
+        """Queue an update to be returned by getUpdates
+        """
+        with self._lock:
+            self._updates.setdefault(bot_token, []).append(update)
+
+    def result(self, bot_token: str, endpoint: str, params: dict):
+        """Get result of an API call, keeping webhooks and pending updates state per bot
+        """
+        with self._lock:
+            if endpoint == 'setWebhook':
+                self._webhooks[bot_token] = {k: params[k] for k in ('url', 'max_connections', 'allowed_updates')
+                                             if k in params}
+                return True
+
+            if endpoint == 'deleteWebhook':
+                self._webhooks.pop(bot_token, None)
+                return True
+
+            if endpoint == 'getWebhookInfo':
+                updates = self._updates.get(bot_token, [])
+                return dict(_fake.result(endpoint, params), pending_update_count=len(updates),
+                            **self._webhooks.get(bot_token, {}))
+
+            if endpoint == 'getUpdates':
+                offset = int(params.get('offset', 0))
+                limit = int(params.get('limit', 100))
+                updates = [u for u in self._updates.get(bot_token, []) if u['update_id'] >= offset]
+                self._updates[bot_token] = updates
+                return updates[:limit]
+
+        r = _fake.result(endpoint, params)
+        if endpoint == 'getFile':
+            r['file_size'] = self.file_size
+
+        return r
+
+    def start(self):
+        """Start serving in a background thread
+        """
+        self._thread = _threading.Thread(target=self.serve_forever, name='telegram-fake-server', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop serving
+        """
+        self.shutdown()
+        self.server_close()
+        if self._thread:
+            self._thread.join()
@@ -0,0 +1,106 @@
+"""PytSite Telegram Streaming Multipart Encoder
+"""
+__author__ = 'Oleksandr Shepetko'
+__email__ = 'a@shepetko.com'
+__license__ = 'MIT'
+
+import json as _json
+from binascii import hexlify as _hexlify
+from os import urandom as _urandom
+from typing import Dict, Iterator, Optional
+from . import types
+
+
+def _encode_value(value) -> bytes:
+    if isinstance(value, bool):
+        return b'true' if value else b'false'
+    if isinstance(value, (dict, list)):
+        return _json.dumps(value).encode('utf-8')
+
+    return str(value).encode('utf-8')
+
+
+class MultipartBody:
+    """multipart/form-data Request Body, Streamed Part by Part
+
+    Files are read chunk by chunk while the body is being sent, so they are never entirely loaded into memory.
+    """
+
+    def __init__(self, fields: Optional[dict], files: Dict[str, types.InputFile], chunk_size: int = 65536):
+        self._boundary = _hexlify(_urandom(16))
+        self._chunk_size = chunk_size
+        self._parts = []
+        self._length = 0
+
+        for name, value in (fields or {}).items():
+            if value is None or value == '':
+                continue
+
+            head = self._part_head(name)
+            body = _encode_value(value)
+            self._parts.append((head + body + b'\r\n', None))
+            self._length += len(head) + len(body) + 2
+
+        for name, file in files.items():
+            head = self._part_head(name, file.filename, file.mime_type)
+            self._parts.append((head, file))
+            if self._length is not None:
+                self._length = None if file.size is None else self._length + len(head) + file.size + 2
+
+        self._tail = b'--' + self._boundary + b'--\r\n'
+        if self._length is not None:
+            self._length += len(self._tail)
+
+    def _part_head(self, name: str, filename: str = None, mime_type: str = None) -> bytes:
+        disposition = 'form-data; name="{}"'.format(name)
+        if filename:
+            disposition += '; filename="{}"'.format(filename.replace('"', '\\"'))
+
+        head = b'--' + self._boundary + b'\r\nContent-Disposition: ' + disposition.encode('utf-8') + b'\r\n'
+        if mime_type:
+            head += b'Content-Type: ' + mime_type.encode('utf-8') + b'\r\n'
+
+        return head + b'\r\n'
+
+    @property
+    def content_type(self) -> str:
+        return 'multipart/form-data; boundary={}'.format(self._boundary.decode('ascii'))
+
+    @property
+    def length(self) -> Optional[int]:
+        """Get body's length, if sizes of all files are known
+        """
+        return self._length
+
+    def __iter__(self) -> Iterator[bytes]:
+        for head, file in self._parts:
+            yield head
+            if file is not None:
+                yield from file.iter_chunks(self._chunk_size)
+                yield b'\r\n'
+
+        yield self._tail
+
+
+class SizedMultipartBody:
+    """Multipart Body of Known Length, Sent With Content-Length Instead of Chunked Encoding
+    """
+
+    def __init__(self, body: MultipartBody):
+        self._body = body
+
+    def __len__(self) -> int:
+        return self._body.length
+
+    def __iter__(self) -> Iterator[bytes]:
+        return iter(self._body)
+
+
+def encode(fields: Optional[dict], files: Dict[str, types.InputFile]):
+    """Encode fields and files into a streamed body
+
+    Returns the body, suitable for `requests`, and its content type.
+    """
+    body = MultipartBody(fields, files)
+
+    return (SizedMultipartBody(body) if body.length is not None else iter(body)), body.content_type
@@ -0,0 +1,257 @@
+"""PytSite Telegram Durable Outbox
+"""
+__author__ = 'Oleksandr Shepetko'
+__email__ = 'a@shepetko.com'
+__license__ = 'MIT'
+
+import os
+import json
+import sqlite3 as _sqlite3
+import threading as _threading
+from time import time as _time
+from typing import Dict, List, Optional
+from pytsite import reg, logger, util
+from . import _api, _sender, metrics as _metrics, error
+
+PENDING = 'pending'
+SENDING = 'sending'
+SENT = 'sent'
+FAILED = 'failed'
+
+_outbox = None  # type: Optional[Outbox]
+_outbox_lock = _threading.Lock()
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    bot_uid TEXT NOT NULL,
+    key TEXT NOT NULL,
+    endpoint TEXT NOT NULL,
+    body BLOB NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt REAL NOT NULL,
+    claimed REAL,
+    created REAL NOT NULL,
+    updated REAL NOT NULL,
+    result TEXT,
+    error TEXT,
+    UNIQUE (bot_uid, key)
+);
+CREATE INDEX IF NOT EXISTS outbox_status_next_attempt ON outbox (status, next_attempt);
+"""
+
+
+class Outbox:
+    """Durable Queue of Outbound API Calls Backed by SQLite
+
+    Calls are stored before they are made and are drained by a background sender thread in batches, so they survive
+    restarts of the process. Bots are identified by their UIDs and must be registered in the process which sends.
+    Several processes may share the same database: each batch is claimed in a transaction. Calls claimed by a process
+    which has died are claimed again after `lease` seconds, so delivery is at least once; idempotency keys prevent
+    duplicates caused by enqueueing the same call again.
+    """
+
+    def __init__(self, path: str, batch_size: int = 50, poll_interval: float = 1.0, max_attempts: int = 10,
+                 lease: float = 300.0, retention: float = 604800.0):
+        self._path = path
+        self._batch_size = batch_size
+        self._poll_interval = poll_interval
+        self._max_attempts = max_attempts
+        self._lease = lease
+        self._retention = retention
+        self._local = _threading.local()
+        self._wakeup = _threading.Event()
+        self._sender = None  # type: Optional[_threading.Thread]
+        self._sender_pid = None  # type: Optional[int]
+        self._sender_lock = _threading.Lock()
+
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._db().executescript(_SCHEMA)
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    def _db(self) -> _sqlite3.Connection:
+        """Get database connection of the current thread
+        """
+        db = getattr(self._local, 'db', None)
+        if db is None or self._local.pid != os.getpid():
+            db = _sqlite3.connect(self._path, timeout=30, isolation_level=None)
+            db.row_factory = _sqlite3.Row
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            self._local.db = db
+            self._local.pid = os.getpid()
+
+        return db
+
+    def put(self, bot_uid: str, endpoint: str, body: bytes, key: str = None) -> str:
+        """Enqueue an API call of a registered bot, POSTing a JSON body
+
+        If a call of the same bot with the same `key` is already enqueued, it is not enqueued again. Returns the key.
+        """
+        key = key or util.random_str(32)
+        now = _time()
+        self._db().execute('INSERT OR IGNORE INTO outbox (bot_uid, key, endpoint, body, status, next_attempt, '
+                           'created, updated) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                           (bot_uid, key, endpoint, body, PENDING, now, now, now))
+
+        self.start()
+        self._wakeup.set()
+
+        return key
+
+    def status(self, bot_uid: str, key: str) -> Optional[dict]:
+        """Get delivery status of a bot's call
+
+        Returned dict contains `status`, `attempts`, `created`, `updated`, `error` and `result` of the call.
+        """
+        row = self._db().execute('SELECT status, attempts, created, updated, result, error FROM outbox '
+                                 'WHERE bot_uid = ? AND key = ?', (bot_uid, key)).fetchone()
+        if row is None:
+            return None
+
+        r = dict(row)
+        r['result'] = json.loads(r['result']) if r['result'] else None
+
+        return r
+
+    def stats(self) -> Dict[str, int]:
+        """Get numbers of calls by status
+        """
+        return {row[0]: row[1] for row in self._db().execute('SELECT status, COUNT(*) FROM outbox GROUP BY status')}
+
+    def _claim(self) -> List[_sqlite3.Row]:
+        """Claim a batch of calls due to be sent
+        """
+        db = self._db()
+        now = _time()
+
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            rows = db.execute('SELECT id, bot_uid, key, endpoint, body, attempts FROM outbox '
+                              'WHERE (status = ? AND next_attempt <= ?) OR (status = ? AND claimed < ?) '
+                              'ORDER BY next_attempt LIMIT ?',
+                              (PENDING, now, SENDING, now - self._lease, self._batch_size)).fetchall()
+            if rows:
+                db.execute('UPDATE outbox SET status = ?, claimed = ?, updated = ? WHERE id IN ({})'.format(
+                    ','.join('?' * len(rows))), [SENDING, now, now] + [r['id'] for r in rows])
+            db.execute('COMMIT')
+
+        except Exception:
+            db.execute('ROLLBACK')
+            raise
+
+        return rows
+
+    def _send(self, row: _sqlite3.Row):
+        """Make a claimed call and record its outcome
+        """
+        db = self._db()
+        attempts = row['attempts'] + 1
+
+        try:
+            # Calls are made by the bot, so they pass through its middleware chain
+            bot = _api.dispense_bot(row['bot_uid'])
+            with bot.priority(_sender.PRIORITY_BULK):
+                result = bot._request(row['endpoint'], method='POST', body=row['body'])
+            db.execute('UPDATE outbox SET status = ?, attempts = ?, updated = ?, result = ?, error = NULL '
+                       'WHERE id = ?', (SENT, attempts, _time(), json.dumps(result), row['id']))
+            return
+
+        except error.ApiRequestError as e:
+            code = e.response.status_code
+            retry_after = None
+            if code == 429:
+                try:
+                    retry_after = e.response.json()['parameters']['retry_after']
+                except (ValueError, KeyError, TypeError):
+                    pass
+
+            # Client errors, except of flood control, are not going to be fixed by retrying
+            permanent = 400 <= code < 500 and code != 429
+            err = '{}: {}'.format(code, e.response.content.decode('utf-8', 'replace'))
+
+        except error.DeadlineExceeded as e:
+            permanent, retry_after, err = False, None, str(e)
+
+        except Exception as e:
+            permanent, retry_after, err = False, None, '{}: {}'.format(type(e).__name__, e)
+
+        if permanent or attempts >= self._max_attempts:
+            logger.error("Outbox call '{}' of {} failed after {} attempts: {}".format(
+                row['key'], row['endpoint'], attempts, err))
+            db.execute('UPDATE outbox SET status = ?, attempts = ?, updated = ?, error = ? WHERE id = ?',
+                       (FAILED, attempts, _time(), err, row['id']))
+        else:
+            sink = _metrics.get_sink()
+            if sink:
+                bot = _api._BOTS.get(row['bot_uid'])
+                sink.inc('telegram_api_retries_total', 1, {'bot': _metrics.bot_label(bot[1]) if bot else row['bot_uid'],
+                                                           'endpoint': row['endpoint']})
+            delay = retry_after if retry_after is not None else min(2 ** attempts, 300)
+            db.execute('UPDATE outbox SET status = ?, attempts = ?, next_attempt = ?, updated = ?, error = ? '
+                       'WHERE id = ?', (PENDING, attempts, _time() + delay, _time(), err, row['id']))
+
+    def _purge(self):
+        """Remove old calls which are done
+        """
+        self._db().execute('DELETE FROM outbox WHERE status IN (?, ?) AND updated < ?',
+                           (SENT, FAILED, _time() - self._retention))
+
+    def _run(self):
+        last_purge = 0.0
+        while True:
+            self._wakeup.wait(self._poll_interval)
+            self._wakeup.clear()
+
+            try:
+                rows = self._claim()
+                while rows:
+                    for row in rows:
+                        self._send(row)
+                    rows = self._claim()
+
+                if _time() - last_purge >= 3600:
+                    self._purge()
+                    last_purge = _time()
+
+            except Exception as e:
+                logger.error('Error while draining outbox {}: {}'.format(self._path, e))
+
+    def start(self):
+        """Start the sender thread of the current process, if it is not started yet
+        """
+        # Threads do not survive fork, so worker processes start their own sender
+        pid = os.getpid()
+        if self._sender is None or self._sender_pid != pid:
+            with self._sender_lock:
+                if self._sender is None or self._sender_pid != pid:
+                    self._sender = _threading.Thread(target=self._run, name='telegram-outbox', daemon=True)
+                    self._sender.start()
+                    self._sender_pid = pid
+
+
+def get_outbox() -> Outbox:
+    """Get the outbox, creating it on first use
+
+    The database is stored at the `telegram.outbox_path` registry parameter, `paths.storage`/telegram/outbox.db by
+    default.
+    """
+    global _outbox
+
+    if _outbox is None:
+        with _outbox_lock:
+            if _outbox is None:
+                path = reg.get('telegram.outbox_path') or os.path.join(reg.get('paths.storage'), 'telegram',
+                                                                        'outbox.db')
+                _outbox = Outbox(path, reg.get('telegram.outbox_batch_size', 50),
+                                 reg.get('telegram.outbox_poll_interval', 1.0),
+                                 reg.get('telegram.outbox_max_attempts', 10), reg.get('telegram.outbox_lease', 300),
+                                 reg.get('telegram.outbox_retention', 604800))
+                _metrics.register_gauge('telegram_outbox_calls', lambda: {
+                    (('status', k),): v for k, v in _outbox.stats().items()}, 'Calls in the outbox by status')
+
+    return _outbox
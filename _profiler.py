@@ -0,0 +1,189 @@
+"""PytSite Telegram Updates Sampling Profiler
+"""
+__author__ = 'Oleksandr Shepetko'
+__email__ = 'a@shepetko.com'
+__license__ = 'MIT'
+
+import os
+import sys
+import json
+import threading as _threading
+from itertools import count as _count
+from time import monotonic as _monotonic, time as _time, sleep as _sleep
+from typing import Dict, List, Optional
+from pytsite import reg, logger
+
+_local = _threading.local()
+_updates_counter = _count(1)
+_sampler = None  # type: Optional[_Sampler]
+_sampler_pid = None  # type: Optional[int]
+_sampler_lock = _threading.Lock()
+
+_MAX_STACK_DEPTH = 128
+
+
+class Profile:
+    """Profile of a single update's processing
+    """
+
+    def __init__(self, bot_label: str, update_id: int, kind: str, reason: str):
+        self.bot_label = bot_label
+        self.update_id = update_id
+        self.kind = kind
+        self.reason = reason
+        self.thread_id = _threading.get_ident()
+        self.started = _monotonic()
+        self.duration = None  # type: Optional[float]
+        self.samples = {}  # type: Dict[str, int]
+        self.calls = []  # type: List[dict]
+
+    def add_sample(self, frame):
+        """Record a sampled stack in collapsed form
+        """
+        stack = []
+        while frame is not None and len(stack) < _MAX_STACK_DEPTH:
+            code = frame.f_code
+            stack.append('{}:{}'.format(code.co_filename, code.co_name))
+            frame = frame.f_back
+
+        key = ';'.join(reversed(stack))
+        self.samples[key] = self.samples.get(key, 0) + 1
+
+    def add_call(self, endpoint: str, started: float, finished: float, err: Exception = None):
+        """Record an outbound API call
+        """
+        self.calls.append({
+            'endpoint': endpoint,
+            'start': round(started - self.started, 6),
+            'duration': round(finished - started, 6),
+            'error': str(err) if err else None,
+        })
+
+    def as_jsonable(self, interval: float) -> dict:
+        return {
+            'bot': self.bot_label,
+            'update_id': self.update_id,
+            'kind': self.kind,
+            'reason': self.reason,
+            'duration': self.duration,
+            'interval': interval,
+            'stacks': self.samples,
+            'calls': self.calls,
+        }
+
+
+class _Sampler(_threading.Thread):
+    """Thread periodically sampling stacks of threads which process profiled updates
+    """
+
+    def __init__(self, interval: float):
+        super().__init__(name='telegram-profiler', daemon=True)
+        self.interval = interval
+        self._profiles = {}  # type: Dict[int, Profile]
+        self._lock = _threading.Lock()
+        self._active = _threading.Event()
+
+    def attach(self, profile: Profile):
+        with self._lock:
+            self._profiles[profile.thread_id] = profile
+            self._active.set()
+
+    def detach(self, profile: Profile):
+        with self._lock:
+            self._profiles.pop(profile.thread_id, None)
+            if not self._profiles:
+                self._active.clear()
+
+    def run(self):
+        while True:
+            self._active.wait()
+            _sleep(self.interval)
+
+            frames = sys._current_frames()
+            with self._lock:
+                for thread_id, profile in self._profiles.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        profile.add_sample(frame)
+
+            del frames
+
+
+def _get_sampler() -> _Sampler:
+    """Get the sampler thread of the current process, starting it on first use
+    """
+    global _sampler, _sampler_pid
+
+    # Threads do not survive fork, so worker processes start their own sampler
+    pid = os.getpid()
+    if _sampler is None or _sampler_pid != pid:
+        with _sampler_lock:
+            if _sampler is None or _sampler_pid != pid:
+                _sampler = _Sampler(reg.get('telegram.profile_interval', 0.005))
+                _sampler.start()
+                _sampler_pid = pid
+
+    return _sampler
+
+
+def current() -> Optional[Profile]:
+    """Get profile of the update being processed by the current thread
+    """
+    return getattr(_local, 'profile', None)
+
+
+def start(bot_label: str, update_id: int, kind: str) -> Optional[Profile]:
+    """Start profiling of an update, if it should be profiled
+
+    Every `telegram.profile_sample_rate`-th update is profiled. If `telegram.profile_threshold` is set, all updates
+    are sampled, but only those processed longer than the threshold are dumped.
+    """
+    if current() is not None:
+        return None
+
+    rate = reg.get('telegram.profile_sample_rate', 0)
+    threshold = reg.get('telegram.profile_threshold', 0)
+    if rate and next(_updates_counter) % rate == 0:
+        reason = 'rate'
+    elif threshold:
+        reason = 'threshold'
+    else:
+        return None
+
+    profile = Profile(bot_label, update_id, kind, reason)
+    _local.profile = profile
+    _get_sampler().attach(profile)
+
+    return profile
+
+
+def stop(profile: Profile):
+    """Stop profiling of an update and dump the profile
+    """
+    _local.profile = None
+    sampler = _get_sampler()
+    sampler.detach(profile)
+    profile.duration = round(_monotonic() - profile.started, 6)
+
+    if profile.reason == 'threshold' and profile.duration < reg.get('telegram.profile_threshold', 0):
+        return
+
+    try:
+        dump(profile, sampler.interval)
+    except Exception as e:
+        logger.error('Cannot dump profile of update {}: {}'.format(profile.update_id, e))
+
+
+def dump(profile: Profile, interval: float) -> str:
+    """Write a profile to the `telegram.profile_dir` directory
+    """
+    dir_path = reg.get('telegram.profile_dir') or os.path.join(reg.get('paths.tmp'), 'telegram', 'profiles')
+    os.makedirs(dir_path, exist_ok=True)
+
+    path = os.path.join(dir_path, '{}-{}-{}.json'.format(int(_time() * 1000), profile.bot_label, profile.update_id))
+    with open(path, 'wt') as f:
+        json.dump(profile.as_jsonable(interval), f)
+
+    logger.info('Profile of update {} processed in {}s dumped to {}'.format(profile.update_id, profile.duration, path))
+
+    return path
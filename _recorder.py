@@ -0,0 +1,139 @@
+"""PytSite Telegram Updates Recorder
+"""
+__author__ = 'Oleksandr Shepetko'
+__email__ = 'a@shepetko.com'
+__license__ = 'MIT'
+
+import os
+import gzip
+import json
+import atexit
+import heapq as _heapq
+import threading as _threading
+from glob import glob as _glob
+from time import time as _time
+from typing import Iterable, Iterator, Optional, Tuple
+from pytsite import reg, logger
+
+_recorder = None  # type: Optional[Recorder]
+_recorder_lock = _threading.Lock()
+
+
+class Recorder:
+    """Writer of incoming updates into gzip-compressed JSONL segments
+
+    Each line is a JSON array of a receiving timestamp, a bot UID and raw update data. A segment is closed and a new one
+    is started after `segment_size` records or `segment_age` seconds.
+    """
+
+    def __init__(self, dir_path: str, segment_size: int = 10000, segment_age: int = 3600):
+        self._dir_path = dir_path
+        self._segment_size = segment_size
+        self._segment_age = segment_age
+        self._lock = _threading.Lock()
+        self._pid = os.getpid()
+        self._file = None
+        self._records = 0
+        self._opened = 0.0
+
+        os.makedirs(dir_path, exist_ok=True)
+
+    @property
+    def dir_path(self) -> str:
+        return self._dir_path
+
+    def _open(self, now: float):
+        path = os.path.join(self._dir_path, 'updates-{}-{}.jsonl.gz'.format(int(now * 1000), self._pid))
+        self._file = gzip.open(path, 'wt', encoding='utf-8')
+        self._records = 0
+        self._opened = now
+
+    def write(self, bot_uid: str, data: dict):
+        """Append an update to the current segment
+        """
+        now = _time()
+        line = json.dumps([round(now, 6), bot_uid, data], separators=(',', ':')) + '\n'
+
+        with self._lock:
+            if self._file and (self._records >= self._segment_size or now - self._opened >= self._segment_age):
+                self._file.close()
+                self._file = None
+
+            if not self._file:
+                self._open(now)
+
+            self._file.write(line)
+            self._records += 1
+
+    def close(self):
+        """Close current segment
+        """
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+
+
+def get_recorder() -> Optional[Recorder]:
+    """Get recorder of the current process if recording is enabled by the `telegram.record_dir` registry parameter
+    """
+    global _recorder
+
+    dir_path = reg.get('telegram.record_dir')
+    if not dir_path:
+        return None
+
+    # Each process writes its own segments
+    if _recorder is None or _recorder.dir_path != dir_path or _recorder._pid != os.getpid():
+        with _recorder_lock:
+            if _recorder is None or _recorder.dir_path != dir_path or _recorder._pid != os.getpid():
+                _recorder = Recorder(dir_path, reg.get('telegram.record_segment_size', 10000),
+                                     reg.get('telegram.record_segment_age', 3600))
+                atexit.register(_recorder.close)
+
+    return _recorder
+
+
+def record(bot_uid: str, data: dict):
+    """Record an incoming update, if recording is enabled
+    """
+    try:
+        recorder = get_recorder()
+        if recorder:
+            recorder.write(bot_uid, data)
+    except Exception as e:
+        logger.error('Cannot record update: {}'.format(e))
+
+
+def list_segments(paths: Iterable[str]) -> list:
+    """Get segment files from a list of files and directories, ordered by time
+    """
+    r = []
+    for path in paths:
+        if os.path.isdir(path):
+            r.extend(_glob(os.path.join(path, 'updates-*.jsonl.gz')))
+        else:
+            r.append(path)
+
+    return sorted(r, key=lambda p: os.path.basename(p))
+
+
+def _iter_segment(path: str) -> Iterator[Tuple[float, str, dict]]:
+    try:
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    ts, bot_uid, data = json.loads(line)
+                    yield ts, bot_uid, data
+
+    # Segment was not closed properly
+    except (EOFError, ValueError) as e:
+        logger.warn('Segment {} is truncated: {}'.format(path, e))
+
+
+def iter_records(paths: Iterable[str]) -> Iterator[Tuple[float, str, dict]]:
+    """Iterate over recorded updates in order of receiving
+
+    Segments written concurrently by different processes are merged by timestamps.
+    """
+    return _heapq.merge(*[_iter_segment(p) for p in list_segments(paths)], key=lambda r: r[0])
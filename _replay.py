@@ -0,0 +1,112 @@
+"""PytSite Telegram Recorded Updates Replay
+"""
+__author__ = 'Oleksandr Shepetko'
+__email__ = 'a@shepetko.com'
+__license__ = 'MIT'
+
+import queue as _queue
+import threading as _threading
+from math import ceil as _ceil
+from time import monotonic as _monotonic, sleep as _sleep
+from typing import Iterable, List
+from . import _api, _fake, _recorder, _workers, middleware, types
+
+
+class StubMiddleware(middleware.Middleware):
+    """Middleware which answers outbound API calls with fake results instead of calling Telegram
+    """
+
+    def request(self, bot, call: middleware.ApiCall, call_next):
+        return _fake.result(call.endpoint, _fake.parse_params(call.params, call.data, call.body))
+
+
+class ReplayStats:
+    """Results of a replay
+    """
+
+    def __init__(self):
+        self.processed = 0
+        self.failed = 0
+        self.duration = 0.0
+        self.latencies = []  # type: List[float]
+        self._lock = _threading.Lock()
+
+    def add(self, latency: float, failed: bool):
+        with self._lock:
+            self.processed += 1
+            self.latencies.append(latency)
+            if failed:
+                self.failed += 1
+
+    @property
+    def throughput(self) -> float:
+        return self.processed / self.duration if self.duration else 0.0
+
+    def percentile(self, p: float) -> float:
+        """Get a latency percentile using the nearest-rank method
+        """
+        if not self.latencies:
+            return 0.0
+
+        values = sorted(self.latencies)
+        return values[max(0, min(len(values), _ceil(p / 100.0 * len(values))) - 1)]
+
+
+def replay(paths: Iterable[str], speed: float = 1.0, threads: int = 8, stub: bool = True) -> ReplayStats:
+    """Feed recorded updates into registered bots
+
+    Updates are submitted at original pace divided by `speed`, or as fast as possible if `speed` is zero. They are
+    processed by `threads` threads sharded by chat ID, like in production. Latency of an update is measured from the
+    moment it is scheduled to be submitted until it is processed, so it includes time spent in the queue.
+    """
+    stats = ReplayStats()
+    shards = [_queue.Queue(1000) for _ in range(max(1, threads))]
+
+    def worker(q: _queue.Queue):
+        while True:
+            task = q.get()
+            if task is None:
+                break
+
+            scheduled, bot_uid, data = task
+            failed = False
+            try:
+                _api.dispense_bot(bot_uid).process_update(types.Update(data))
+            except Exception:
+                failed = True
+
+            stats.add(_monotonic() - scheduled, failed)
+
+    stub_mw = StubMiddleware() if stub else None
+    if stub_mw:
+        middleware.register(stub_mw)
+
+    workers = [_threading.Thread(target=worker, args=(q,), daemon=True) for q in shards]
+    for t in workers:
+        t.start()
+
+    start = _monotonic()
+    try:
+        first_ts = None
+        for ts, bot_uid, data in _recorder.iter_records(paths):
+            if first_ts is None:
+                first_ts = ts
+
+            scheduled = start + (ts - first_ts) / speed if speed else _monotonic()
+            delay = scheduled - _monotonic()
+            if delay > 0:
+                _sleep(delay)
+
+            shards[hash(_workers.update_chat_id(data)) % len(shards)].put((scheduled, bot_uid, data))
+
+        for q in shards:
+            q.put(None)
+        for t in workers:
+            t.join()
+
+    finally:
+        stats.duration = _monotonic() - start
+        if stub_mw:
+            middleware.unregister(stub_mw)
+
+    return stats
@@ -0,0 +1,151 @@
+"""PytSite Telegram Outbound Calls Scheduler
+"""
+__author__ = 'Oleksandr Shepetko'
+__email__ = 'a@shepetko.com'
+__license__ = 'MIT'
+
+import threading as _threading
+import heapq as _heapq
+from itertools import count as _count
+from time import monotonic as _monotonic
+from typing import Dict, Optional
+from pytsite import reg
+from . import metrics as _metrics, error as _error
+
+# Priority classes, lower value is served first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_NORMAL = 1
+PRIORITY_BULK = 2
+
+# Endpoints which must be answered within seconds
+_INTERACTIVE_ENDPOINTS = {
+    'answerCallbackQuery',
+    'answerInlineQuery',
+    'answerShippingQuery',
+    'answerPreCheckoutQuery',
+}
+
+_PRIORITY_NAMES = {
+    PRIORITY_INTERACTIVE: 'interactive',
+    PRIORITY_NORMAL: 'normal',
+    PRIORITY_BULK: 'bulk',
+}
+
+# Default time to wait for a rate limit slot, in seconds, per priority class
+_DEFAULT_DEADLINES = {
+    'interactive': 10.0,
+    'normal': None,
+    'bulk': None,
+}
+
+_schedulers = {}  # type: Dict[str, Scheduler]
+_schedulers_lock = _threading.Lock()
+
+
+def endpoint_priority(endpoint: str) -> int:
+    """Get default priority class of an endpoint
+    """
+    return PRIORITY_INTERACTIVE if endpoint in _INTERACTIVE_ENDPOINTS else PRIORITY_NORMAL
+
+
+def priority_deadline(priority: int) -> Optional[float]:
+    """Get default deadline of a priority class, in seconds
+    """
+    name = _PRIORITY_NAMES.get(priority, 'normal')
+
+    return reg.get('telegram.deadlines', {}).get(name, _DEFAULT_DEADLINES[name])
+
+
+class Scheduler:
+    """Token Bucket Rate Limiter Serving Waiting Calls in Order of Priority
+    """
+
+    def __init__(self, rate: float, burst: float = None):
+        if rate <= 0:
+            raise ValueError('Rate must be greater than zero')
+
+        self._rate = rate
+        self._burst = burst or rate
+        self._tokens = self._burst
+        self._stamp = _monotonic()
+        self._cond = _threading.Condition()
+        self._waiting = []
+        self._seq = _count()
+
+    @property
+    def depth(self) -> int:
+        """Get number of waiting calls
+        """
+        return sum(1 for entry in self._waiting if not entry[2])
+
+    def _take_token(self, now: float) -> float:
+        """Take a token, returning 0, or return time to wait until a token becomes available
+        """
+        self._tokens = min(self._burst, self._tokens + (now - self._stamp) * self._rate)
+        self._stamp = now
+
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0
+
+        return (1 - self._tokens) / self._rate
+
+    def acquire(self, priority: int = PRIORITY_NORMAL, deadline: float = None):
+        """Wait for a rate limit slot
+
+        Raises `error.DeadlineExceeded` if the slot cannot be obtained until `deadline`, which is a value of
+        `time.monotonic()`.
+        """
+        entry = [priority, next(self._seq), False]
+
+        with self._cond:
+            _heapq.heappush(self._waiting, entry)
+
+            try:
+                while True:
+                    now = _monotonic()
+                    if deadline is not None and now >= deadline:
+                        raise _error.DeadlineExceeded(priority)
+
+                    # Drop heads abandoned by timed out callers
+                    while self._waiting[0][2]:
+                        _heapq.heappop(self._waiting)
+
+                    timeout = None
+                    if self._waiting[0] is entry:
+                        timeout = self._take_token(now)
+                        if not timeout:
+                            _heapq.heappop(self._waiting)
+                            entry[2] = True
+                            self._cond.notify_all()
+                            return
+
+                    if deadline is not None:
+                        timeout = min(timeout, deadline - now) if timeout else deadline - now
+
+                    self._cond.wait(timeout)
+
+            finally:
+                if not entry[2]:
+                    entry[2] = True
+                    self._cond.notify_all()
+
+
+def get_scheduler(bot_token: str, rate: float) -> Scheduler:
+    """Get scheduler of a bot
+    """
+    try:
+        return _schedulers[bot_token]
+    except KeyError:
+        with _schedulers_lock:
+            if bot_token not in _schedulers:
+                _schedulers[bot_token] = Scheduler(rate)
+            return _schedulers[bot_token]
+
+
+def _schedulers_depths() -> dict:
+    return {(('bot', _metrics.bot_label(token)),): s.depth for token, s in list(_schedulers.items())}
+
+
+_metrics.register_gauge('telegram_rate_limit_queue_depth', _schedulers_depths,
+                        'API calls waiting for a rate limit slot')
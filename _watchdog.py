@@ -0,0 +1,138 @@
+"""PytSite Telegram Slow Updates Watchdog
+"""
+__author__ = 'Oleksandr Shepetko'
+__email__ = 'a@shepetko.com'
+__license__ = 'MIT'
+
+import os
+import sys
+import threading as _threading
+import traceback as _traceback
+from time import monotonic as _monotonic, sleep as _sleep
+from typing import Dict, Optional
+from pytsite import reg, logger
+from . import metrics as _metrics
+
+_local = _threading.local()
+_watchdog = None  # type: Optional[_Watchdog]
+_watchdog_pid = None  # type: Optional[int]
+_watchdog_lock = _threading.Lock()
+
+
+class Task:
+    """Update being processed under a deadline
+    """
+
+    def __init__(self, bot_label: str, update_id: int, kind: str, budget: float):
+        self.bot_label = bot_label
+        self.update_id = update_id
+        self.kind = kind
+        self.thread_id = _threading.get_ident()
+        self.started = _monotonic()
+        self.deadline = self.started + budget
+        self.overdue = False
+
+    @property
+    def remaining(self) -> float:
+        """Get time left until the deadline, in seconds
+        """
+        return self.deadline - _monotonic()
+
+
+class _Watchdog(_threading.Thread):
+    """Thread which reports updates processed longer than their deadline
+    """
+
+    def __init__(self, interval: float):
+        super().__init__(name='telegram-watchdog', daemon=True)
+        self._interval = interval
+        self._tasks = {}  # type: Dict[int, Task]
+        self._lock = _threading.Lock()
+        self._wakeup = _threading.Event()
+
+    def add(self, task: Task):
+        with self._lock:
+            self._tasks[id(task)] = task
+            self._wakeup.set()
+
+    def remove(self, task: Task):
+        with self._lock:
+            self._tasks.pop(id(task), None)
+
+    def run(self):
+        while True:
+            with self._lock:
+                if not self._tasks:
+                    self._wakeup.clear()
+            self._wakeup.wait()
+
+            _sleep(self._interval)
+            now = _monotonic()
+            with self._lock:
+                overdue = [t for t in self._tasks.values() if not t.overdue and now >= t.deadline]
+                for task in overdue:
+                    task.overdue = True
+
+            if not overdue:
+                continue
+
+            frames = sys._current_frames()
+            for task in overdue:
+                frame = frames.get(task.thread_id)
+                stack = ''.join(_traceback.format_stack(frame)) if frame else 'unavailable\n'
+                logger.warn("Update {} ({}) of bot '{}' is being processed longer than {:.1f}s, stack:\n{}".format(
+                    task.update_id, task.kind, task.bot_label, now - task.started, stack))
+
+                sink = _metrics.get_sink()
+                if sink:
+                    sink.inc('telegram_updates_overdue_total', 1, {'bot': task.bot_label, 'kind': task.kind})
+
+            del frames
+
+
+def _get_watchdog() -> _Watchdog:
+    """Get the watchdog thread of the current process, starting it on first use
+    """
+    global _watchdog, _watchdog_pid
+
+    # Threads do not survive fork, so worker processes start their own watchdog
+    pid = os.getpid()
+    if _watchdog is None or _watchdog_pid != pid:
+        with _watchdog_lock:
+            if _watchdog is None or _watchdog_pid != pid:
+                _watchdog = _Watchdog(reg.get('telegram.watchdog_interval', 0.5))
+                _watchdog.start()
+                _watchdog_pid = pid
+
+    return _watchdog
+
+
+def current() -> Optional[Task]:
+    """Get deadline task of the update being processed by the current thread
+    """
+    return getattr(_local, 'task', None)
+
+
+def watch(bot_label: str, update_id: int, kind: str) -> Optional[Task]:
+    """Start watching an update, if the `telegram.update_deadline` registry parameter is set
+    """
+    budget = reg.get('telegram.update_deadline', 0)
+    if not budget or current() is not None:
+        return None
+
+    task = Task(bot_label, update_id, kind, budget)
+    _local.task = task
+    _get_watchdog().add(task)
+
+    return task
+
+
+def unwatch(task: Task):
+    """Stop watching an update
+    """
+    _local.task = None
+    _get_watchdog().remove(task)
+
+    if task.overdue:
+        logger.warn("Update {} ({}) of bot '{}' processed in {:.3f}s".format(
+            task.update_id, task.kind, task.bot_label, _monotonic() - task.started))
@@ -0,0 +1,312 @@
+"""PytSite Telegram Update Workers
+"""
+__author__ = 'Oleksandr Shepetko'
+__email__ = 'a@shepetko.com'
+__license__ = 'MIT'
+
+import importlib as _importlib
+import multiprocessing as _multiprocessing
+import queue as _queue
+import threading as _threading
+import traceback as _traceback
+from multiprocessing.connection import wait as _wait
+from time import monotonic as _monotonic
+from typing import Optional, List
+from pytsite import logger, reg
+from . import metrics as _metrics
+
+_pool = None  # type: Optional[ShardPool]
+_pool_lock = _threading.Lock()
+
+
+def update_chat_id(data: dict) -> int:
+    """Extract an ID of the chat an update belongs to from the raw update's data
+    """
+    for k in ('message', 'edited_message', 'channel_post', 'edited_channel_post'):
+        if k in data:
+            return data[k]['chat']['id']
+
+    if 'callback_query' in data:
+        if 'message' in data['callback_query']:
+            return data['callback_query']['message']['chat']['id']
+        return data['callback_query']['from']['id']
+
+    for k in ('inline_query', 'chosen_inline_result', 'shipping_query', 'pre_checkout_query'):
+        if k in data:
+            return data[k]['from']['id']
+
+    return data.get('update_id', 0)
+
+
+class _ForwardingSink(_metrics.Sink):
+    """Metrics sink of a worker process, which buffers metrics to be sent to the parent process along with results
+    """
+
+    # Metrics of updates processing are recorded by the parent process from results
+    _SKIPPED = ('telegram_updates_total', 'telegram_update_duration_seconds')
+
+    def __init__(self):
+        self._events = []
+        self._lock = _threading.Lock()
+
+    def observe(self, name: str, value: float, labels: dict):
+        if name not in self._SKIPPED:
+            with self._lock:
+                self._events.append(('observe', name, value, labels))
+
+    def inc(self, name: str, value: float, labels: dict):
+        if name not in self._SKIPPED:
+            with self._lock:
+                self._events.append(('inc', name, value, labels))
+
+    def flush(self) -> list:
+        with self._lock:
+            events, self._events = self._events, []
+
+        return events
+
+
+def _resolve_bot(bot_uid: str, bot_class: str, token: str):
+    """Register a bot in a worker process from a task's data, if it is not registered yet
+    """
+    from . import _api, error
+
+    if bot_uid in _api._BOTS:
+        return
+
+    module_name, _, qualname = bot_class.partition(':')
+    try:
+        cls = _importlib.import_module(module_name)
+        for name in qualname.split('.'):
+            cls = getattr(cls, name)
+    except (ImportError, AttributeError):
+        raise error.BotNotRegistered(bot_uid)
+
+    _api._BOTS[bot_uid] = (cls, token, False)
+
+
+def _worker_main(shard: int, generation: int, in_queue: _multiprocessing.Queue, out_queue: _multiprocessing.Queue):
+    """Worker process's main loop
+    """
+    # Imported here to use module state inherited from the parent process
+    from . import _api, types, error
+
+    # Metrics recorded into the inherited copy of the sink would never be exported
+    sink = _ForwardingSink() if _metrics.get_sink() else None
+    _metrics.set_sink(sink)
+
+    while True:
+        task = in_queue.get()
+        if task is None:
+            break
+
+        bot_uid, bot_class, token, data = task
+        update = types.Update(data)
+        start = _monotonic()
+        err = None
+        try:
+            _resolve_bot(bot_uid, bot_class, token)
+            _api.dispense_bot(bot_uid).process_update(update)
+        except error.BotNotRegistered as e:
+            err = str(e)
+        except Exception:
+            err = _traceback.format_exc()
+
+        out_queue.put((shard, generation, bot_uid, update.update_id, err, _monotonic() - start, update.kind,
+                       sink.flush() if sink else None))
+
+
+class ShardPool:
+    """Pool of worker processes which process updates sharded by chat ID
+
+    Updates of the same chat are always routed to the same worker, so they are processed in the order of arrival.
+    Workers are watched and restarted if they die; updates queued to a dead worker are handed over to its successor
+    when possible and are counted as failed otherwise. Bots are resolved by workers from data sent along with each
+    update, so bots registered after workers are started, and workers restarted later, behave the same way. Bot
+    classes therefore must be importable by their module and qualified name.
+    """
+
+    def __init__(self, size: int, check_interval: float = 1.0):
+        if size < 1:
+            raise ValueError('Pool size must be greater than zero')
+
+        # Fork context is required, because workers rely on the application state of the parent process
+        self._ctx = _multiprocessing.get_context('fork')
+
+        self._size = size
+        self._check_interval = check_interval
+        self._lock = _threading.Lock()
+        self._pending = 0
+        self._processed = 0
+        self._failed = 0
+        self._restarted = 0
+        self._stopping = False
+        self._shard_pending = [0] * size
+        self._generations = [0] * size
+        self._in_queues = [self._ctx.Queue() for _ in range(size)]  # type: List[_multiprocessing.Queue]
+        self._out_queue = self._ctx.Queue()
+        self._processes = [self._start_worker(i) for i in range(size)]
+
+        self._collector = _threading.Thread(target=self._collect, name='telegram-shard-pool', daemon=True)
+        self._collector.start()
+        self._monitor = _threading.Thread(target=self._watch, name='telegram-shard-pool-monitor', daemon=True)
+        self._monitor.start()
+
+    def _start_worker(self, shard: int):
+        p = self._ctx.Process(target=_worker_main, daemon=True, args=(
+            shard, self._generations[shard], self._in_queues[shard], self._out_queue))
+        p.start()
+
+        return p
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    @property
+    def pending(self) -> int:
+        """Get number of submitted but not yet processed updates
+        """
+        return self._pending
+
+    @property
+    def processed(self) -> int:
+        return self._processed
+
+    @property
+    def failed(self) -> int:
+        return self._failed
+
+    @property
+    def restarted(self) -> int:
+        """Get number of workers restarted after they died
+        """
+        return self._restarted
+
+    def submit(self, bot_uid: str, data: dict):
+        """Submit an update's raw data for processing
+        """
+        from . import _api, error
+
+        try:
+            bot_class, token = _api._BOTS[bot_uid][:2]
+        except KeyError:
+            raise error.BotNotRegistered(bot_uid)
+
+        task = (bot_uid, '{}:{}'.format(bot_class.__module__, bot_class.__qualname__), token, data)
+        shard = hash(update_chat_id(data)) % self._size
+        with self._lock:
+            self._pending += 1
+            self._shard_pending[shard] += 1
+            self._in_queues[shard].put(task)
+
+    def on_result(self, bot_uid: str, update_id: int, err: Optional[str], duration: float, kind: str = None):
+        """Hook, called in the parent process after a worker has processed an update
+
+        Records metrics of the update's processing, so overriding methods should call it.
+        """
+        if err:
+            logger.error('Error while processing update {} by bot {}: {}'.format(update_id, bot_uid, err))
+
+        sink = _metrics.get_sink()
+        if sink:
+            from . import _api
+            bot = _api._BOTS.get(bot_uid)
+            labels = {'bot': _metrics.bot_label(bot[1]) if bot else bot_uid, 'kind': kind}
+            sink.inc('telegram_updates_total', 1, labels)
+            sink.observe('telegram_update_duration_seconds', duration, labels)
+
+    def _collect(self):
+        while True:
+            result = self._out_queue.get()
+            if result is None:
+                break
+
+            shard, generation = result[:2]
+            with self._lock:
+                # Results of a dead worker's generation were already written off
+                if generation != self._generations[shard]:
+                    continue
+                self._pending -= 1
+                self._shard_pending[shard] -= 1
+                self._processed += 1
+                if result[4]:
+                    self._failed += 1
+
+            # Metrics recorded by the worker while processing the update
+            sink = _metrics.get_sink()
+            if sink and result[7]:
+                for op, name, value, labels in result[7]:
+                    getattr(sink, op)(name, value, labels)
+
+            try:
+                self.on_result(*result[2:7])
+            except Exception as e:
+                logger.error(e)
+
+    def _watch(self):
+        while not self._stopping:
+            _wait([p.sentinel for p in self._processes], self._check_interval)
+
+            for shard, p in enumerate(self._processes):
+                if not p.is_alive() and not self._stopping:
+                    self._restart_worker(shard, p.exitcode)
+
+    def _restart_worker(self, shard: int, exitcode: int):
+        """Replace a dead worker, handing its queued updates over to the new one
+        """
+        with self._lock:
+            old_queue = self._in_queues[shard]
+            new_queue = self._ctx.Queue()
+
+            # The dead worker might hold the queue's read lock, so the queue is drained without blocking
+            salvaged = 0
+            while True:
+                try:
+                    task = old_queue.get(False)
+                except (_queue.Empty, OSError, EOFError):
+                    break
+                if task is not None:
+                    new_queue.put(task)
+                    salvaged += 1
+
+            lost = self._shard_pending[shard] - salvaged
+            self._pending -= lost
+            self._failed += lost
+            self._shard_pending[shard] = salvaged
+            self._generations[shard] += 1
+            self._in_queues[shard] = new_queue
+            self._processes[shard] = self._start_worker(shard)
+            self._restarted += 1
+
+        logger.error('Shard pool worker {} died with exit code {}, restarted; {} queued updates handed over, {} lost'
+                     .format(shard, exitcode, salvaged, lost))
+
+    def shutdown(self, timeout: float = None):
+        """Stop all workers after they finish queued updates
+        """
+        self._stopping = True
+
+        for q in self._in_queues:
+            q.put(None)
+
+        for p in self._processes:
+            p.join(timeout)
+
+        self._out_queue.put(None)
+        self._collector.join(timeout)
+
+
+def get_pool(size: int) -> ShardPool:
+    """Get the process-wide shard pool, starting it on first use
+    """
+    global _pool
+
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ShardPool(size, reg.get('telegram.workers_check_interval', 1.0))
+                _metrics.register_gauge('telegram_shard_pool_pending', lambda: _pool.pending,
+                                        'Updates submitted to worker processes and not yet processed')
+
+    return _pool
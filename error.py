@@ -70,9 +70,35 @@ class FileNotFound(ApiRequestError):
         return "File with ID '{}' is not found".format(self._id)
 
 
+class FileTooLarge(Error):
+    def __init__(self, url: str, max_size: int):
+        self._url = url
+        self._max_size = max_size
+
+    def __str__(self) -> str:
+        return "File at '{}' exceeds maximum allowed size of {} bytes".format(self._url, self._max_size)
+
+
 class ChatNotFound(ApiRequestError):
     def __init__(self, chat_id: str):
         self._id = chat_id
 
     def __str__(self) -> str:
         return "Chat with ID '{}' is not found".format(self._id)
+
+
+class DeadlineExceeded(Error):
+    def __init__(self, priority: int):
+        self._priority = priority
+
+    def __str__(self) -> str:
+        return "Deadline of an API call with priority {} exceeded".format(self._priority)
+
+
+class UpdateDeadlineExceeded(DeadlineExceeded):
+    def __init__(self, update_id: int, endpoint: str):
+        self._update_id = update_id
+        self._endpoint = endpoint
+
+    def __str__(self) -> str:
+        return "Deadline of update {} exceeded, API call '{}' cancelled".format(self._update_id, self._endpoint)
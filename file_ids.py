@@ -0,0 +1,103 @@
+"""PytSite Telegram Plugin Uploaded Files IDs Storage
+"""
+__author__ = 'Oleksandr Shepetko'
+__email__ = 'a@shepetko.com'
+__license__ = 'MIT'
+
+import threading as _threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict as _OrderedDict
+from typing import Optional
+from pytsite import cache, reg
+
+_store = None  # type: Optional[Store]
+
+
+class Store(ABC):
+    """Base Class for Storages Mapping Content Hashes to File IDs
+    """
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[str]:
+        pass
+
+    @abstractmethod
+    def put(self, key: str, file_id: str):
+        pass
+
+
+class MemoryStore(Store):
+    """In-memory Storage With LRU Eviction
+    """
+
+    def __init__(self, max_size: int = 10000):
+        self._max_size = max_size
+        self._items = _OrderedDict()
+        self._lock = _threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            try:
+                self._items.move_to_end(key)
+                return self._items[key]
+            except KeyError:
+                return None
+
+    def put(self, key: str, file_id: str):
+        with self._lock:
+            self._items[key] = file_id
+            self._items.move_to_end(key)
+            while len(self._items) > self._max_size:
+                self._items.popitem(last=False)
+
+
+class CacheStore(MemoryStore):
+    """Persistent Storage Backed by a Cache Pool With an In-memory LRU Front
+    """
+
+    def __init__(self, max_size: int = 10000, ttl: int = 2592000):
+        super().__init__(max_size)
+        self._ttl = ttl
+        self._pool = cache.create_pool('telegram.file_ids')
+
+    def get(self, key: str) -> Optional[str]:
+        file_id = super().get(key)
+        if file_id is None:
+            try:
+                file_id = self._pool.get(key)
+                super().put(key, file_id)
+            except cache.error.KeyNotExist:
+                pass
+
+        return file_id
+
+    def put(self, key: str, file_id: str):
+        super().put(key, file_id)
+        self._pool.put(key, file_id, self._ttl)
+
+
+def set_store(store: Optional[Store]):
+    """Set storage, None resets it to the default one
+    """
+    global _store
+
+    if store is not None and not isinstance(store, Store):
+        raise TypeError('{} expected, got {}'.format(Store, type(store)))
+
+    _store = store
+
+
+def get_store() -> Optional[Store]:
+    """Get storage, creating the default one on first use
+
+    The default storage is created unless the `telegram.file_ids_cache` registry parameter is False.
+    """
+    global _store
+
+    if _store is None and reg.get('telegram.file_ids_cache', True):
+        _store = CacheStore(reg.get('telegram.file_ids_cache_size', 10000), reg.get('telegram.file_ids_ttl', 2592000))
+
+    return _store
@@ -0,0 +1,48 @@
+"""PytSite Telegram Plugin Inline Mode Helpers
+"""
+__author__ = 'Oleksandr Shepetko'
+__email__ = 'a@shepetko.com'
+__license__ = 'MIT'
+
+from typing import Iterable, List, Tuple
+from itertools import islice as _islice
+
+# Maximum number of results allowed per answer by Telegram
+MAX_RESULTS = 50
+
+
+def decode_offset(offset: str) -> int:
+    """Convert an inline query's offset into an index of the first result of a page
+    """
+    try:
+        return max(int(offset), 0) if offset else 0
+    except ValueError:
+        return 0
+
+
+def encode_offset(index: int) -> str:
+    """Convert an index of the first result of a page into an inline query's offset
+    """
+    return str(index)
+
+
+def paginate(items: Iterable, offset: str, page_size: int = MAX_RESULTS) -> Tuple[List, str]:
+    """Get a page of results and the offset of the next page
+
+    Lazy iterables are consumed only up to the end of the requested page. The next offset is an empty string if there
+    are no more results.
+    """
+    if not 0 < page_size <= MAX_RESULTS:
+        raise ValueError('Page size must be between 1 and {}'.format(MAX_RESULTS))
+
+    start = decode_offset(offset)
+
+    if isinstance(items, (list, tuple)):
+        page = list(items[start:start + page_size + 1])
+    else:
+        page = list(_islice(items, start, start + page_size + 1))
+
+    if len(page) > page_size:
+        return page[:page_size], encode_offset(start + page_size)
+
+    return page, ''
@@ -0,0 +1,140 @@
+"""PytSite Telegram Plugin Metrics
+"""
+__author__ = 'Oleksandr Shepetko'
+__email__ = 'a@shepetko.com'
+__license__ = 'MIT'
+
+import threading as _threading
+from abc import ABC, abstractmethod
+from bisect import bisect_left as _bisect_left
+from typing import Callable, Dict, Optional, Tuple, Union
+
+_sink = None  # type: Optional[Sink]
+
+# Gauges, evaluated on demand
+_GAUGES = {}  # type: Dict[str, Tuple[str, Callable[[], Union[float, Dict[tuple, float]]]]]
+
+_DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Sink(ABC):
+    """Base Class for Metrics Sinks
+    """
+
+    @abstractmethod
+    def observe(self, name: str, value: float, labels: dict):
+        """Record a value of a histogram
+        """
+        pass
+
+    @abstractmethod
+    def inc(self, name: str, value: float, labels: dict):
+        """Increment a counter
+        """
+        pass
+
+
+class PrometheusSink(Sink):
+    """Sink Aggregating Metrics in Memory for Prometheus Text Exposition
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = _DEFAULT_BUCKETS):
+        self._buckets = tuple(sorted(buckets))
+        self._histograms = {}  # type: Dict[str, Dict[tuple, list]]
+        self._counters = {}  # type: Dict[str, Dict[tuple, float]]
+        self._lock = _threading.Lock()
+
+    def observe(self, name: str, value: float, labels: dict):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            h = series.get(key)
+            if h is None:
+                # Per-bucket counts, followed by count of values above all buckets and sum of values
+                h = series[key] = [0] * (len(self._buckets) + 1) + [0.0]
+            h[_bisect_left(self._buckets, value)] += 1
+            h[-1] += value
+
+    def inc(self, name: str, value: float, labels: dict):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    @staticmethod
+    def _labels(labels: tuple, extra: tuple = ()) -> str:
+        items = labels + extra
+        if not items:
+            return ''
+
+        return '{' + ','.join('{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"'))
+                              for k, v in items) + '}'
+
+    def render(self) -> str:
+        """Render metrics in Prometheus text exposition format
+        """
+        lines = []
+
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                lines.append('# TYPE {} counter'.format(name))
+                for labels, value in series.items():
+                    lines.append('{}{} {}'.format(name, self._labels(labels), value))
+
+            for name, series in sorted(self._histograms.items()):
+                lines.append('# TYPE {} histogram'.format(name))
+                for labels, h in series.items():
+                    cumulative = 0
+                    for bound, count in zip(self._buckets, h):
+                        cumulative += count
+                        lines.append('{}_bucket{} {}'.format(name, self._labels(labels, (('le', bound),)),
+                                                             cumulative))
+                    cumulative += h[-2]
+                    lines.append('{}_bucket{} {}'.format(name, self._labels(labels, (('le', '+Inf'),)), cumulative))
+                    lines.append('{}_sum{} {}'.format(name, self._labels(labels), h[-1]))
+                    lines.append('{}_count{} {}'.format(name, self._labels(labels), cumulative))
+
+        for name, (help_text, fn) in sorted(_GAUGES.items()):
+            lines.append('# HELP {} {}'.format(name, help_text))
+            lines.append('# TYPE {} gauge'.format(name))
+            value = fn()
+            if isinstance(value, dict):
+                for labels, v in value.items():
+                    lines.append('{}{} {}'.format(name, self._labels(tuple(labels)), v))
+            else:
+                lines.append('{} {}'.format(name, value))
+
+        return '\n'.join(lines) + '\n'
+
+
+def set_sink(sink: Optional[Sink]):
+    """Set metrics sink, None disables metrics
+    """
+    global _sink
+
+    if sink is not None and not isinstance(sink, Sink):
+        raise TypeError('{} expected, got {}'.format(Sink, type(sink)))
+
+    _sink = sink
+
+
+def get_sink() -> Optional[Sink]:
+    """Get metrics sink
+
+    Instrumented code checks the sink before measuring anything, so metrics cost nothing while there is no sink.
+    """
+    return _sink
+
+
+def register_gauge(name: str, fn: Callable[[], Union[float, Dict[tuple, float]]], help_text: str = ''):
+    """Register a gauge
+
+    `fn` returns either a value or a dict of values keyed by label tuples like `(('bot', '123'),)`.
+    """
+    _GAUGES[name] = (help_text, fn)
+
+
+def bot_label(bot_token: str) -> str:
+    """Get a label identifying a bot without exposing its token
+    """
+    return bot_token.split(':')[0]
@@ -0,0 +1,110 @@
+"""PytSite Telegram Plugin Middleware
+"""
+__author__ = 'Oleksandr Shepetko'
+__email__ = 'a@shepetko.com'
+__license__ = 'MIT'
+
+from typing import Callable, Dict, List, Tuple
+from time import monotonic as _monotonic
+
+_MIDDLEWARES = []  # type: List[Middleware]
+
+
+class ApiCall:
+    """Outbound Telegram API Call
+
+    Parameters are copied, so middleware may modify them without affecting the caller, e.g. on retries.
+    """
+
+    def __init__(self, endpoint: str, params: dict = None, data: dict = None, method: str = 'GET',
+                 priority: int = None, deadline: float = None, files: dict = None, body: bytes = None,
+                 timeout: float = None):
+        self.endpoint = endpoint
+        self.params = dict(params) if params is not None else None
+        self.data = dict(data) if data is not None else None
+        self.method = method
+        self.priority = priority
+        self.deadline = deadline
+        self.files = files
+        self.body = body
+        self.timeout = timeout
+
+    def __str__(self) -> str:
+        return '{}: {} {}'.format(self.__class__.__name__, self.method, self.endpoint)
+
+
+class Middleware:
+    """Base Middleware
+
+    Middleware wraps update processing and outbound API calls of bots. To short-circuit the processing, a middleware
+    simply does not call `call_next`.
+    """
+
+    @property
+    def name(self) -> str:
+        return self.__class__.__name__
+
+    def process_update(self, bot, update, call_next: Callable):
+        """Hook, wraps processing of an incoming update
+        """
+        return call_next(update)
+
+    def request(self, bot, call: ApiCall, call_next: Callable):
+        """Hook, wraps an outbound API call
+        """
+        return call_next(call)
+
+    def report_timings(self, bot, subject, timings: Dict[str, float]):
+        """Hook, receives own latency of each pipeline stage after an update or an API call has been processed
+        """
+        pass
+
+
+def register(middleware: Middleware):
+    """Register a global middleware
+    """
+    if not isinstance(middleware, Middleware):
+        raise TypeError('{} expected, got {}'.format(Middleware, type(middleware)))
+
+    if middleware not in _MIDDLEWARES:
+        _MIDDLEWARES.append(middleware)
+
+
+def unregister(middleware: Middleware):
+    """Unregister a global middleware
+    """
+    if middleware in _MIDDLEWARES:
+        _MIDDLEWARES.remove(middleware)
+
+
+def get_chain(bot) -> Tuple[Middleware, ...]:
+    """Get middleware chain of a bot
+    """
+    return tuple(_MIDDLEWARES) + tuple(bot.middlewares)
+
+
+def run(chain: Tuple[Middleware, ...], hook: str, core: Callable, core_name: str, bot, subject):
+    """Run a subject through a middleware chain and the core handler
+    """
+    totals = [0.0] * (len(chain) + 1)
+
+    def stage(i: int) -> Callable:
+        def call(s):
+            start = _monotonic()
+            try:
+                if i == len(chain):
+                    return core(s)
+                return getattr(chain[i], hook)(bot, s, stage(i + 1))
+            finally:
+                totals[i] = _monotonic() - start
+
+        return call
+
+    try:
+        return stage(0)(subject)
+
+    finally:
+        timings = {mw.name: totals[i] - totals[i + 1] for i, mw in enumerate(chain)}
+        timings[core_name] = totals[-1]
+        for mw in chain:
+            mw.report_timings(bot, subject, timings)
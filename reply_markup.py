@@ -4,9 +4,11 @@ __author__ = 'Oleksandr Shepetko'
 __email__ = 'a@shepetko.com'
 __license__ = 'MIT'
 
-from typing import Type, List
+import json as _json
+from itertools import islice as _islice
+from typing import Type, List, Iterable, Callable, Any, Optional, Sequence
 from abc import abstractmethod
-from . import types
+from . import types, _callback_data
 
 
 class AbstractKeyboardButton(types.JSONable):
@@ -69,6 +71,7 @@ class InlineButton(AbstractKeyboardButton):
 class Keyboard(types.JSONable):
     """Normal Keyboard Buttons Container
     """
+    _jsonable = None
 
     def __init__(self, buttons: List[List[AbstractKeyboardButton]] = None, _expected_button_type: Type = Button):
         """Init
@@ -97,9 +100,27 @@ class Keyboard(types.JSONable):
 
         return r
 
+    @property
+    def frozen(self) -> bool:
+        return self._jsonable is not None
+
+    def _check_not_frozen(self):
+        if self.frozen:
+            raise RuntimeError('Frozen keyboard cannot be modified')
+
+    def freeze(self):
+        """Make the keyboard immutable and cache its JSONable representation
+        """
+        if not self.frozen:
+            self._rows = tuple(tuple(row) for row in self._rows)
+            self._jsonable = self.as_jsonable()
+
+        return self
+
     def append_row(self):
         """Append a row
         """
+        self._check_not_frozen()
         self._rows.append([])
 
         return self
@@ -107,6 +128,8 @@ class Keyboard(types.JSONable):
     def append_button(self, button: AbstractKeyboardButton, row_num: int = None):
         """Append a button to a row
         """
+        self._check_not_frozen()
+
         if not self._rows and row_num is None:
             self.append_row()
 
@@ -125,6 +148,9 @@ class Keyboard(types.JSONable):
         return self
 
     def as_jsonable(self) -> list:
+        if self._jsonable is not None:
+            return self._jsonable
+
         r = []
 
         for row in self._rows:
@@ -146,9 +172,103 @@ class InlineKeyboard(Keyboard):
         super().__init__(buttons, InlineButton)
 
 
+class PagedInlineKeyboard(InlineKeyboard):
+    """Inline Keyboard Showing a Page of Items With Navigation Buttons
+
+    Only items of the visible page are turned into buttons. Sequences are sliced, lazy iterables are consumed only up
+    to the end of the page.
+    """
+
+    def __init__(self, items: Iterable, button_factory: Callable[[Any], InlineButton], page: int = 0,
+                 page_size: int = 10, columns: int = 1, nav_prefix: str = 'page', prev_text: str = '«',
+                 next_text: str = '»'):
+        if page < 0:
+            raise ValueError('Page number cannot be negative')
+
+        if page_size < 1 or columns < 1:
+            raise ValueError('Page size and number of columns must be greater than zero')
+
+        start = page * page_size
+        if isinstance(items, Sequence):
+            visible = items[start:start + page_size + 1]
+        else:
+            visible = list(_islice(items, start, start + page_size + 1))
+
+        self._page = page
+        self._has_next = len(visible) > page_size
+
+        buttons = [button_factory(item) for item in visible[:page_size]]
+        rows = [buttons[i:i + columns] for i in range(0, len(buttons), columns)]
+
+        nav_row = []
+        if page > 0:
+            nav_row.append(InlineButton(prev_text, callback_data=self.nav_callback_data(page - 1, nav_prefix)))
+        if self._has_next:
+            nav_row.append(InlineButton(next_text, callback_data=self.nav_callback_data(page + 1, nav_prefix)))
+        if nav_row:
+            rows.append(nav_row)
+
+        super().__init__(rows)
+
+    @property
+    def page(self) -> int:
+        return self._page
+
+    @property
+    def has_next(self) -> bool:
+        return self._has_next
+
+    @staticmethod
+    def nav_callback_data(page: int, nav_prefix: str = 'page') -> str:
+        """Get callback data of a navigation button
+        """
+        return '{}:{}'.format(nav_prefix, page)
+
+    @staticmethod
+    def parse_nav_callback_data(data: str, nav_prefix: str = 'page') -> Optional[int]:
+        """Get page number from callback data of a navigation button, or None if it is not a navigation one
+        """
+        if not data or not data.startswith(nav_prefix + ':'):
+            return None
+
+        try:
+            return max(int(data[len(nav_prefix) + 1:]), 0)
+        except ValueError:
+            return None
+
+
 class ReplyMarkup(types.JSONable):
     """Base Class for Reply Markup
     """
+    _json = None
+
+    @property
+    def frozen(self) -> bool:
+        return self._json is not None
+
+    def _freeze_keyboard(self):
+        """Hook
+        """
+        pass
+
+    def freeze(self):
+        """Make the markup immutable and cache its JSON representation
+
+        Useful for static markups, which are sent many times.
+        """
+        if not self.frozen:
+            self._freeze_keyboard()
+            self._json = _json.dumps(self.as_jsonable(), separators=(',', ':'))
+
+        return self
+
+    def as_json(self) -> str:
+        """Get JSON representation
+        """
+        if self._json is not None:
+            return self._json
+
+        return _json.dumps(self.as_jsonable(), separators=(',', ':'))
 
     @abstractmethod
     def as_jsonable(self):
@@ -171,6 +291,9 @@ class ReplyKeyboardMarkup(ReplyMarkup):
     def __len__(self):
         return len(self._keyboard)
 
+    def _freeze_keyboard(self):
+        self._keyboard.freeze()
+
     def as_jsonable(self) -> dict:
         return {
             'keyboard': self._keyboard.as_jsonable(),
@@ -186,15 +309,32 @@ class InlineKeyboardMarkup(ReplyMarkup):
     https://core.telegram.org/bots/api#inlinekeyboardmarkup
     """
 
-    def __init__(self, inline_keyboard: Keyboard):
+    def __init__(self, inline_keyboard: Keyboard, store_callback_data: bool = False):
+        """Init
+
+        If `store_callback_data` is set, buttons' callback data exceeding 64 bytes is stored on the server side and
+        replaced with short tokens, which are resolved back on receiving of callback queries.
+        """
         self._inline_keyboard = inline_keyboard
+        self._store_callback_data = store_callback_data
 
     def __len__(self):
         return len(self._inline_keyboard)
 
+    def _freeze_keyboard(self):
+        if self._store_callback_data:
+            raise RuntimeError('Markup with server-side stored callback data cannot be frozen')
+
+        self._inline_keyboard.freeze()
+
     def as_jsonable(self) -> dict:
+        # Callback data is packed into every representation, including one embedded into inline query results
+        keyboard = self._inline_keyboard.as_jsonable()
+        if self._store_callback_data:
+            keyboard = _callback_data.pack(keyboard)
+
         return {
-            'inline_keyboard': self._inline_keyboard.as_jsonable()
+            'inline_keyboard': keyboard
         }
 
 
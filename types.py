@@ -4,7 +4,10 @@ __author__ = 'Oleksandr Shepetko'
 __email__ = 'a@shepetko.com'
 __license__ = 'MIT'
 
-from typing import Optional, Union, Type
+import os as _os
+import hashlib as _hashlib
+import mimetypes as _mimetypes
+from typing import Optional, Union, Type, Iterable, Iterator, BinaryIO
 from abc import ABC, abstractmethod
 from datetime import datetime
 
@@ -22,6 +25,12 @@ class TelegramType:
     def __str__(self) -> str:
         return '{}: {}'.format(self.__class__.__name__, self._data)
 
+    @property
+    def raw(self):
+        """Get raw data the object was built from
+        """
+        return self._data
+
 
 class NotImplementedType:
     def __init__(self, *args, **kwargs):
@@ -40,13 +49,153 @@ class Array(TelegramType):
         return self._items[index]
 
 
+class InputFile:
+    """File to be Uploaded
+
+    Source may be a path, a binary file object, bytes or an iterable of bytes chunks. Paths are opened only while the
+    file is being sent.
+
+    https://core.telegram.org/bots/api#inputfile
+    """
+
+    def __init__(self, source: Union[str, _os.PathLike, BinaryIO, bytes, Iterable[bytes]], filename: str = None,
+                 mime_type: str = None):
+        if isinstance(source, (str, _os.PathLike)):
+            source = _os.fspath(source)
+            if not _os.path.isfile(source):
+                raise FileNotFoundError(source)
+        elif isinstance(source, bytearray):
+            source = bytes(source)
+        elif not (isinstance(source, bytes) or hasattr(source, 'read') or hasattr(source, '__iter__')):
+            raise TypeError('Path, file object, bytes or iterable expected, got {}'.format(type(source)))
+
+        if not filename:
+            name = source if isinstance(source, str) else getattr(source, 'name', None)
+            filename = _os.path.basename(name) if isinstance(name, str) else 'file'
+
+        self._source = source
+        self._start = None if self._is_one_shot() or not hasattr(source, 'read') else source.tell()
+        self._filename = filename
+        self._mime_type = mime_type or _mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        self._digest = None  # type: Optional[str]
+
+    @classmethod
+    def wrap(cls, media):
+        """Wrap media to be sent into an input file
+
+        Returns None if `media` is a string, i. e. it is a file ID or URL. Strings are never treated as paths, so
+        local files are uploaded only if given as `os.PathLike` objects, file objects or `InputFile`.
+        """
+        if isinstance(media, InputFile):
+            return media
+
+        if isinstance(media, str):
+            return None
+
+        return cls(media)
+
+    @property
+    def source(self):
+        return self._source
+
+    @property
+    def filename(self) -> str:
+        return self._filename
+
+    @property
+    def mime_type(self) -> str:
+        return self._mime_type
+
+    @property
+    def size(self) -> Optional[int]:
+        """Get number of bytes remaining to be sent, if it is known
+        """
+        if isinstance(self._source, str):
+            return _os.path.getsize(self._source)
+
+        if isinstance(self._source, bytes):
+            return len(self._source)
+
+        try:
+            return _os.fstat(self._source.fileno()).st_size - self._source.tell()
+        except (AttributeError, OSError, ValueError):
+            return None
+
+    @property
+    def digest(self) -> Optional[str]:
+        """Get SHA-256 hex digest of the file's content
+
+        Content of paths, bytes and seekable file objects is hashed on demand. Content of other sources is hashed while
+        being sent, so their digest is not known until the file has been entirely read.
+        """
+        if self._digest is None and not self._is_one_shot():
+            h = _hashlib.sha256()
+            pos = self._source.tell() if hasattr(self._source, 'read') else None
+            for chunk in self.iter_chunks():
+                h.update(chunk)
+            if pos is not None:
+                self._source.seek(pos)
+            self._digest = h.hexdigest()
+
+        return self._digest
+
+    def rewind(self) -> bool:
+        """Rewind the file to be sent again
+
+        Returns False if the source can be read only once.
+        """
+        if self._is_one_shot():
+            return False
+
+        if self._start is not None:
+            self._source.seek(self._start)
+
+        return True
+
+    def _is_one_shot(self) -> bool:
+        """Check whether the source can be read only once
+        """
+        if isinstance(self._source, (str, bytes)):
+            return False
+
+        try:
+            return not (hasattr(self._source, 'read') and self._source.seekable())
+        except (AttributeError, ValueError):
+            return True
+
+    def iter_chunks(self, chunk_size: int = 65536) -> Iterator[bytes]:
+        """Read the file chunk by chunk
+        """
+        if isinstance(self._source, bytes):
+            for i in range(0, len(self._source), chunk_size):
+                yield self._source[i:i + chunk_size]
+
+        elif isinstance(self._source, str):
+            with open(self._source, 'rb') as f:
+                yield from iter(lambda: f.read(chunk_size), b'')
+
+        elif not self._is_one_shot():
+            yield from iter(lambda: self._source.read(chunk_size), b'')
+
+        else:
+            h = _hashlib.sha256() if self._digest is None else None
+            chunks = iter(lambda: self._source.read(chunk_size), b'') if hasattr(self._source, 'read') else self._source
+            for chunk in chunks:
+                if h:
+                    h.update(chunk)
+                yield chunk
+
+            if h:
+                self._digest = h.hexdigest()
+
+
 class File(TelegramType):
     def __init__(self, data: dict):
         super().__init__(data)
 
         self._file_id = data['file_id']  # type: str
-        self._file_size = data['file_size']  # type: Optional[int]
-        self._file_path = data['file_path']  # type: Optional[str]
+        self._file_size = data.get('file_size')  # type: Optional[int]
+        self._file_path = data.get('file_path')  # type: Optional[str]
 
     @property
     def file_id(self) -> str:
@@ -647,7 +796,7 @@ class MessageEntity(TelegramType):
         self._offset = data['offset']  # type: int
         self._length = data['length']  # type: int
         self._url = data.get('url')  # type: Optional[str]
-        self._user = User(data) if 'user' in data else None
+        self._user = User(data['user']) if 'user' in data else None
 
     @property
     def type(self) -> str:
@@ -1064,6 +1213,57 @@ class Message(TelegramType):
         return self._successful_payment
 
 
+class MediaGroup(TelegramType):
+    """Messages of an Album
+
+    Built from raw data of messages sharing the same `media_group_id`.
+    """
+
+    def __init__(self, data: Union[list, tuple]):
+        if not data:
+            raise ValueError('Media group cannot be empty')
+
+        super().__init__(data)
+
+        self._messages = sorted((Message(item) for item in data), key=lambda m: m.message_id)
+
+    def __len__(self) -> int:
+        return len(self._messages)
+
+    def __iter__(self):
+        return iter(self._messages)
+
+    @property
+    def media_group_id(self) -> str:
+        return self._messages[0].media_group_id
+
+    @property
+    def messages(self) -> list:
+        return self._messages
+
+    @property
+    def sender(self) -> Optional[User]:
+        return self._messages[0].sender
+
+    @property
+    def chat(self) -> Chat:
+        return self._messages[0].chat
+
+    @property
+    def caption(self) -> Optional[str]:
+        for msg in self._messages:
+            if msg.caption:
+                return msg.caption
+
+
+class MessageArray(Array):
+    def __init__(self, data: Union[list, tuple]):
+        super().__init__(data, Message)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
 class CallbackQuery(TelegramType):
     def __init__(self, data):
         super().__init__(data)
@@ -1100,6 +1300,10 @@ class CallbackQuery(TelegramType):
     def data(self) -> Optional[str]:
         return self._query_data
 
+    @data.setter
+    def data(self, value: Optional[str]):
+        self._query_data = value
+
     @property
     def game_short_name(self) -> Optional[str]:
         return self._game_short_name
@@ -1111,6 +1315,9 @@ class Update(TelegramType):
     https://core.telegram.org/bots/api#update
     """
 
+    KINDS = ('message', 'edited_message', 'channel_post', 'edited_channel_post', 'inline_query', 'chosen_inline_result',
+             'callback_query', 'shipping_query', 'pre_checkout_query')
+
     def __init__(self, data: dict):
         super().__init__(data)
 
@@ -1131,6 +1338,14 @@ class Update(TelegramType):
     def update_id(self) -> int:
         return self._update_id
 
+    @property
+    def kind(self) -> Optional[str]:
+        """Get kind of the update, i. e. name of its only optional field present
+        """
+        for k in self.KINDS:
+            if k in self._data:
+                return k
+
     @property
     def message(self) -> Optional[Message]:
         return self._message
@@ -1166,3 +1381,209 @@ class Update(TelegramType):
     @property
     def pre_checkout_query(self) -> Optional[PreCheckoutQuery]:
         return self._pre_checkout_query
+
+
+class InputMessageContent(JSONable):
+    """Base Class for Content of a Message to be Sent as a Result of an Inline Query
+
+    https://core.telegram.org/bots/api#inputmessagecontent
+    """
+    pass
+
+
+class InputTextMessageContent(InputMessageContent):
+    """Text Content of a Message
+
+    https://core.telegram.org/bots/api#inputtextmessagecontent
+    """
+
+    def __init__(self, message_text: str, parse_mode: str = 'HTML', disable_web_page_preview: bool = False):
+        self._message_text = message_text
+        self._parse_mode = parse_mode
+        self._disable_web_page_preview = disable_web_page_preview
+
+    def as_jsonable(self) -> dict:
+        return {
+            'message_text': self._message_text,
+            'parse_mode': self._parse_mode,
+            'disable_web_page_preview': self._disable_web_page_preview,
+        }
+
+
+class InlineQueryResult(JSONable):
+    """Base Class for Results of an Inline Query
+
+    https://core.telegram.org/bots/api#inlinequeryresult
+    """
+
+    def __init__(self, result_type: str, result_id: str, reply_markup: JSONable = None,
+                 input_message_content: InputMessageContent = None, **fields):
+        if len(str(result_id).encode('utf-8')) > 64:
+            raise ValueError('Result ID must not exceed 64 bytes')
+
+        self._type = result_type
+        self._id = str(result_id)
+        self._reply_markup = reply_markup
+        self._input_message_content = input_message_content
+        self._fields = fields
+
+    @property
+    def id(self) -> str:
+        return self._id
+
+    def as_jsonable(self) -> dict:
+        r = {'type': self._type, 'id': self._id}
+
+        for k, v in self._fields.items():
+            if v is not None:
+                r[k] = v
+
+        if self._reply_markup:
+            r['reply_markup'] = self._reply_markup.as_jsonable()
+
+        if self._input_message_content:
+            r['input_message_content'] = self._input_message_content.as_jsonable()
+
+        return r
+
+
+class InlineQueryResultArticle(InlineQueryResult):
+    """Link to an Article or Web Page
+
+    https://core.telegram.org/bots/api#inlinequeryresultarticle
+    """
+
+    def __init__(self, result_id: str, title: str, input_message_content: InputMessageContent,
+                 reply_markup: JSONable = None, url: str = None, hide_url: bool = None, description: str = None,
+                 thumb_url: str = None, thumb_width: int = None, thumb_height: int = None):
+        super().__init__('article', result_id, reply_markup, input_message_content, title=title, url=url,
+                         hide_url=hide_url, description=description, thumb_url=thumb_url, thumb_width=thumb_width,
+                         thumb_height=thumb_height)
+
+
+class InlineQueryResultPhoto(InlineQueryResult):
+    """Link to a Photo
+
+    https://core.telegram.org/bots/api#inlinequeryresultphoto
+    """
+
+    def __init__(self, result_id: str, photo_url: str, thumb_url: str, photo_width: int = None,
+                 photo_height: int = None, title: str = None, description: str = None, caption: str = None,
+                 parse_mode: str = None, reply_markup: JSONable = None,
+                 input_message_content: InputMessageContent = None):
+        super().__init__('photo', result_id, reply_markup, input_message_content, photo_url=photo_url,
+                         thumb_url=thumb_url, photo_width=photo_width, photo_height=photo_height, title=title,
+                         description=description, caption=caption, parse_mode=parse_mode)
+
+
+class InlineQueryResultCachedPhoto(InlineQueryResult):
+    """Photo Stored on the Telegram Servers
+
+    https://core.telegram.org/bots/api#inlinequeryresultcachedphoto
+    """
+
+    def __init__(self, result_id: str, photo_file_id: str, title: str = None, description: str = None,
+                 caption: str = None, parse_mode: str = None, reply_markup: JSONable = None,
+                 input_message_content: InputMessageContent = None):
+        super().__init__('photo', result_id, reply_markup, input_message_content, photo_file_id=photo_file_id,
+                         title=title, description=description, caption=caption, parse_mode=parse_mode)
+
+
+class InlineQueryResultDocument(InlineQueryResult):
+    """Link to a File
+
+    https://core.telegram.org/bots/api#inlinequeryresultdocument
+    """
+
+    def __init__(self, result_id: str, title: str, document_url: str, mime_type: str, caption: str = None,
+                 parse_mode: str = None, description: str = None, reply_markup: JSONable = None,
+                 input_message_content: InputMessageContent = None, thumb_url: str = None):
+        super().__init__('document', result_id, reply_markup, input_message_content, title=title,
+                         document_url=document_url, mime_type=mime_type, caption=caption, parse_mode=parse_mode,
+                         description=description, thumb_url=thumb_url)
+
+
+class InlineQueryResultCachedDocument(InlineQueryResult):
+    """File Stored on the Telegram Servers
+
+    https://core.telegram.org/bots/api#inlinequeryresultcacheddocument
+    """
+
+    def __init__(self, result_id: str, title: str, document_file_id: str, description: str = None,
+                 caption: str = None, parse_mode: str = None, reply_markup: JSONable = None,
+                 input_message_content: InputMessageContent = None):
+        super().__init__('document', result_id, reply_markup, input_message_content, title=title,
+                         document_file_id=document_file_id, description=description, caption=caption,
+                         parse_mode=parse_mode)
+
+
+class InputMedia(JSONable):
+    """Base Class for Media to be Sent in a Group
+
+    `media` may be a file ID or an URL string, or anything else acceptable by `InputFile` to be uploaded.
+
+    https://core.telegram.org/bots/api#inputmedia
+    """
+
+    def __init__(self, media_type: str, media, caption: str = None, parse_mode: str = None, **fields):
+        self._type = media_type
+        self._media = media
+        self._input_file = InputFile.wrap(media)
+        self._caption = caption
+        self._parse_mode = parse_mode
+        self._fields = fields
+
+    @property
+    def type(self) -> str:
+        return self._type
+
+    @property
+    def input_file(self) -> Optional[InputFile]:
+        """Get the file to be uploaded, if any
+        """
+        return self._input_file
+
+    def as_jsonable(self, media: str = None) -> dict:
+        """Get JSONable representation
+
+        `media` overrides the media reference, i. e. a file ID of already uploaded file or an `attach://<name>` one.
+        """
+        if media is None:
+            if self._input_file:
+                raise ValueError('Media reference must be specified for files to be uploaded')
+            media = self._media
+
+        r = {'type': self._type, 'media': media}
+
+        if self._caption is not None:
+            r['caption'] = self._caption
+        if self._parse_mode is not None:
+            r['parse_mode'] = self._parse_mode
+
+        for k, v in self._fields.items():
+            if v is not None:
+                r[k] = v
+
+        return r
+
+
+class InputMediaPhoto(InputMedia):
+    """Photo to be Sent
+
+    https://core.telegram.org/bots/api#inputmediaphoto
+    """
+
+    def __init__(self, media, caption: str = None, parse_mode: str = None):
+        super().__init__('photo', media, caption, parse_mode)
+
+
+class InputMediaVideo(InputMedia):
+    """Video to be Sent
+
+    https://core.telegram.org/bots/api#inputmediavideo
+    """
+
+    def __init__(self, media, caption: str = None, parse_mode: str = None, width: int = None, height: int = None,
+                 duration: int = None, supports_streaming: bool = None):
+        super().__init__('video', media, caption, parse_mode, width=width, height=height, duration=duration,
+                         supports_streaming=supports_streaming)